@@ -1,15 +1,123 @@
 import sys
-from PyQt5.QtWidgets import QApplication
-from .gui import MainWindow
+import json
+import time
+import argparse
+import logging
+import threading
+from importlib import import_module
+
+
+class StartupProfile:
+    # milestones of the startup in ms since main() was entered
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marks = {}
+        self.reported = False
+
+    def mark(self, name):
+        self.marks.setdefault(name, (time.perf_counter() - self.t0) * 1e3)
+
+    def report(self):
+        if not self.reported:
+            self.reported = True
+            self.mark("interactive")
+            print("Startup profile:", json.dumps(self.marks))
+
+
+def run_gui(argv, profile=None):
+    parser = argparse.ArgumentParser(prog="behav_collector")
+    parser.add_argument("--timeline", choices=("matplotlib", "native"), default="matplotlib",
+                        help="timeline widget used for the behavior summary")
+    parser.add_argument("--videos", type=int, default=2, choices=range(1, 9), metavar="{1..8}",
+                        help="number of synchronized video panels")
+    parser.add_argument("--decode-workers", type=int, default=None, metavar="N",
+                        help="decoder processes per video for prefetching "
+                             "(default: spare cores split between the videos, 0 disables)")
+    parser.add_argument("--decoder", choices=("auto", "opencv", "pyav"), default="auto",
+                        help="video decoder backend, auto picks the fastest per file "
+                             "(pyav needs `pip install av`)")
+    parser.add_argument("--disk-cache", type=float, default=0, metavar="GB",
+                        help="keep up to GB of decoded frames on disk across sessions (default: off)")
+    parser.add_argument("--disk-cache-dir", default=None,
+                        help="directory of the disk cache (default: ~/.cache/behavior_collector/frames)")
+    parser.add_argument("--no-restore", action="store_true",
+                        help="do not reopen the videos and annotations of the last session")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the time to a usable window")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help="record the frame pipeline and write it to FILE as a Chrome trace "
+                             "(chrome://tracing, Perfetto) on exit")
+    parser.add_argument("--log-level", default="info",
+                        choices=("debug", "info", "warning", "error"))
+    args, qt_args = parser.parse_known_args(argv)
+    profile = profile if args.profile_startup else None
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s")
+    logging.getLogger(__package__).setLevel(args.log_level.upper())
+
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    from .gui import MainWindow
+    from .gui.utils_gui import FirstPaint
+    from .processing.session_state import default_state_path, load_state
+    if profile is not None:
+        profile.mark("imports")
+
+    disk_cache = None
+    if args.disk_cache > 0:
+        from .processing.disk_cache import DiskFrameCache
+        disk_cache = DiskFrameCache(args.disk_cache_dir, budget=int(args.disk_cache * 1024**3))
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    session_file = default_state_path()
+    window = MainWindow(timeline=args.timeline, num_videos=args.videos,
+                        decode_workers=args.decode_workers, disk_cache=disk_cache,
+                        decoder=args.decoder, session_file=session_file)
+    if profile is not None:
+        profile.mark("window_created")
+
+    def _restore():
+        # runs right after the window is first painted
+        state = {} if args.no_restore else load_state(session_file)
+        if state:
+            window.restore_session(state)
+        restored = window.video_panels[0].video_reader is not None
+        if not restored:
+            # import the decoder in the background while nothing needs it yet
+            threading.Thread(target=import_module, daemon=True,
+                             args=(".processing.video_reader", __package__)).start()
+        if profile is None:
+            return
+        profile.mark("session_restored")
+        if restored:
+            window.coordinator.frame_presented.connect(lambda _: profile.report())
+        else:
+            QTimer.singleShot(0, profile.report)
+
+    def _painted():
+        if profile is not None:
+            profile.mark("window_painted")
+        QTimer.singleShot(0, _restore)
+
+    FirstPaint(window, _painted)
+    if args.trace:
+        from .processing.tracing import tracer
+        tracer.start_recording()
+    window.showFullScreen()
+    status = app.exec_()
+    if args.trace:
+        tracer.export_chrome_trace(args.trace, tracer.stop_recording())
+        print("Trace written to", args.trace)
+    sys.exit(status)
 
 
 def main():
-    app = QApplication(sys.argv)
-    window = MainWindow()
-    window.show()
-    sys.exit(app.exec_())
+    # `behav_collector export ...` runs headless, anything else opens the GUI
+    profile = StartupProfile()
+    if sys.argv[1:2] == ["export"]:
+        from .processing.export import main as export_main
+        sys.exit(export_main(sys.argv[2:]))
+    run_gui(sys.argv[1:], profile)
 
 
 if __name__=="__main__":
     main()
-        
\ No newline at end of file
@@ -5,11 +5,13 @@ from PyQt5.QtWidgets import (
 )
 
 from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QColor
 from collections import OrderedDict
 from typing import List, Dict
 
 from .utils_gui import ColorPicker, error2messagebox
 from ..processing.behavior_collector import BehavInfo
+from ..processing.journal import AnnotationJournal
 
 
 pyqt_KEY_MAP = OrderedDict({  
@@ -33,7 +35,6 @@ BEHAV_KEY_QUIT = Qt.Key_Z
 BEHAV_KEY_USE = 0
     
 
-# TODO: add a behavior remover (button x)
     
     
 class SelectableRow(QPushButton):
@@ -64,7 +65,9 @@ class BehaviorPanel(QGroupBox):
     
     signal_add_behav = pyqtSignal(dict) # name, color
     signal_add_frame = pyqtSignal(dict) # start_frame, end_frame
-    # TODO: signal_remove_frame
+    signal_remove_frame = pyqtSignal(dict) # name, start_frame, end_frame
+    signal_set_frames = pyqtSignal(dict) # name, starts, ends
+    signal_clear = pyqtSignal()
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -72,6 +75,8 @@ class BehaviorPanel(QGroupBox):
         self.setFixedHeight(300)
         self.behav_set = None
         self.behav_pair = None
+        self.journal = None
+        self.annotation_file = None # last loaded or exported file
         self.state_add = (False, None, -1) # (state, key, start_frame)
         self.video_control = None
         
@@ -114,15 +119,45 @@ class BehaviorPanel(QGroupBox):
         self.video_control = video_control
         self.signal_add_behav.connect(self.video_control.behav_plot_panel.add_behavior)
         self.signal_add_frame.connect(self.video_control.behav_plot_panel.add_frame)
+        self.signal_remove_frame.connect(self.video_control.behav_plot_panel.remove_frame)
+        self.signal_set_frames.connect(self.video_control.behav_plot_panel.set_frames)
+        self.signal_clear.connect(self.video_control.behav_plot_panel.clear_behaviors)
     
     def read_frame(self):
         return self.video_control.getFrame()
         
     def receive_video(self, fileinfo):
-        self.behav_set = BehavInfo(fileinfo["filename"], fileinfo["total_frames"])
-        self.behav_set.behav_info = {}
-        self.behav_set.behav_frames = {}
+        # restore the annotations journaled for this video, if any
+        self.close_session()
+        self.behav_set, self.journal = AnnotationJournal.open(fileinfo["filename"],
+                                                              fileinfo["total_frames"])
+        self._populate_from_behav_set()
+    
+    def close_session(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+    
+    def _populate_from_behav_set(self):
+        global BEHAV_KEY_USE
+        
+        # remove the rows of the previous behavior set
+        while self.scroll_layout.count():
+            self.scroll_layout.takeAt(0).widget().deleteLater()
         self.behav_pair = dict()
+        self.state_add = (False, None, -1)
+        BEHAV_KEY_USE = 0
+        self.signal_clear.emit()
+        
+        for behav_name, info in self.behav_set.behav_info.items():
+            self._add_behavior_row(behav_name, info["behavior_type"],
+                                   QColor(info["behavior_color"]), info["behavior_note"])
+            starts, ends = self.behav_set.frame_arrays(behav_name)
+            self.signal_set_frames.emit({
+                "name": behav_name,
+                "starts": starts.copy(),
+                "ends": ends.copy()
+            })
         
     def init_ui_form(self):
         # font_css = "font-family: Arial; font-size: 12pt;"
@@ -156,8 +191,6 @@ class BehaviorPanel(QGroupBox):
     
     @error2messagebox(to_warn=True)
     def _add_behavior(self, *args, name=None, btype=None, color=None):
-        global BEHAV_KEY_USE
-        
         if self.behav_set is None:
             raise ValueError("Behavior set is not initialized")
 
@@ -169,13 +202,17 @@ class BehaviorPanel(QGroupBox):
             color = self.color_picker.color()  # QColor
         note = self.text_note.toPlainText()
         
+        self.behav_set.add_behavior(name, btype, note, color.name())
+        self._add_behavior_row(name, btype, color, note)
+    
+    def _add_behavior_row(self, name, btype, color, note):
+        global BEHAV_KEY_USE
         
         key_qt, key_str = list(pyqt_KEY_MAP.items())[BEHAV_KEY_USE]
         BEHAV_KEY_USE += 1
         
         row_layout = QHBoxLayout()
         
-        self.behav_set.add_behavior(name, btype, note, color.name())
         # Row container
         row = SelectableRow(key_str, name, btype, color)
         self.behav_pair[key_qt] = row
@@ -200,8 +237,8 @@ class BehaviorPanel(QGroupBox):
             return
         
         if pressed_key == BEHAV_KEY_REMOVE:
-            # TODO: remove behavior
-            pass
+            self.remove_frame()
+            return
         
         # Collecting start
         if pressed_key not in self.behav_pair.keys():
@@ -237,22 +274,51 @@ class BehaviorPanel(QGroupBox):
             else:
                 raise ValueError("Behavior type not recognized")
         
+    def remove_frame(self):
+        # remove every bout that covers the current frame
+        nframe = self.read_frame()
+        behav_names = self.behav_set.active_behaviors(nframe)
+        if not behav_names:
+            raise ValueError("No behavior at frame %d"%(nframe))
+        
+        for behav_name in behav_names:
+            frame_range = self.behav_set.remove_frame(behav_name, start_frame=nframe)
+            self.signal_remove_frame.emit({
+                "name": behav_name,
+                "start_frame": frame_range[0],
+                "end_frame": frame_range[-1]
+            })
+        
     def update_panel(self, frame):
         pass
     
     @error2messagebox(to_warn=True)
     def _load_behavior(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Load Behavior",
-                                                   "",
-                                                   "Behavior Files (*.json *.txt)")
+                                                   self.annotation_file or "",
+                                                   "Behavior Files (*.json *.txt *.bhv)")
+        if not file_path:
+            return
+        self.load_annotation(file_path)
+    
+    def load_annotation(self, file_path):
         self.behav_set = BehavInfo.load(file_path)
-        for behav_name in self.behav_set.behav_info.keys():
-            behav_type = self.behav_set.behav_info[behav_name]["behavior_type"]
-            behav_note = self.behav_set.behav_info[behav_name]["behavior_note"]
-            behav_color = self.behav_set.behav_info[behav_name]["behavior_color"]
-            self._add_behavior(behav_name, behav_type, behav_color, behav_note)
-        
-        # TODO: update all the UI based on the loaded behavior
+        self.annotation_file = file_path
+        if self.journal is not None:
+            # the loaded set replaces the session: snapshot it right away
+            self.journal.attach(self.behav_set)
+            self.journal.compact()
+        self._populate_from_behav_set()
     
+    @error2messagebox(to_warn=True)
     def _export_behavior(self):
-        pass
+        if self.behav_set is None:
+            raise ValueError("Behavior set is not initialized")
+        
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Behavior",
+                                                   self.annotation_file or "",
+                                                   "Behavior Files (*.json *.bhv)")
+        if not file_path:
+            return
+        self.behav_set.save(file_path)
+        self.annotation_file = file_path
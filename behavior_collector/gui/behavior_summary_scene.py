@@ -1,33 +1,72 @@
-import matplotlib.pyplot as plt
 import numpy as np
+from functools import wraps
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QSizePolicy
+from PyQt5.QtCore import QTimer
 # from PyQt5.QtWidgets import QSizePolicy
-# from PyQt5.QtCore import QTimer
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
 from typing import List
 
+from ..processing.tracing import tracer
+
 # TODO: add ytick size 
 
+
+def _after_init(method):
+    # calls made before the figure exists are replayed, in order, once it is
+    # built (move_indicator only keeps the latest position instead)
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.figure is None:
+            self._pending.append((method, args, kwargs))
+            return None
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
 class BehaviorPlotWidget(QWidget):
+    """
+    Matplotlib timeline. matplotlib is only imported, and the figure built,
+    after the widget is first painted, so that it does not delay the window.
+    """
     def __init__(self, parent=None):
         super().__init__(parent)
         self.is_full_size = False
         self.local_width = 100
         self.total_frames = 1
         self.num_behaviors = 0
-        self.init_ui()
+        self.cur_frame = 0
+        self.window_start = None # first frame of the displayed page
+        self.background = None # cached static part of the plot, for blitting
+        self.figure = None
+        self._pending = []
+        
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        self.setLayout(layout)
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.canvas.updateGeometry()
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.figure is None:
+            QTimer.singleShot(0, self.init_ui) # once the window is on screen
         
     def init_ui(self):
+        if self.figure is not None:
+            return
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+        
         self.figure = Figure()
         self.canvas = FigureCanvas(self.figure)
+        self.canvas.draw = tracer.traced("timeline.draw")(self.canvas.draw) # full redraws
         self.ax = self.figure.add_subplot(111)
         # self.ax.axis("off")
         self.figure.tight_layout()
         
-        self.line_cur, = self.ax.plot([0, 0], [-1, 20], lw=2, color='k')
+        # the playhead is drawn separately on top of the cached background
+        self.line_cur, = self.ax.plot([0, 0], [-1, 20], lw=2, color='k', animated=True)
+        # a newly added bout, drawn into the cached background without a full redraw
+        self.line_new, = self.ax.plot([], [], ".-", lw=1, animated=True)
         self.line_behavs = {}
         self.ax.set_ylim([-0.5, 1.5])
         
@@ -37,29 +76,69 @@ class BehaviorPlotWidget(QWidget):
         self.ax.tick_params(axis='x', which='both', bottom=False, top=False, labelbottom=False)
         self.ax.set_yticks([])
         
-        layout = QVBoxLayout()
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.setSpacing(0)
-        layout.addWidget(self.canvas)
-        self.setLayout(layout)
+        self.layout().addWidget(self.canvas)
+        self.canvas.updateGeometry()
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        
+        pending, self._pending = self._pending, []
+        for method, args, kwargs in pending:
+            method(self, *args, **kwargs)
+        self.move_indicator(self.cur_frame)
+        
+    def _on_draw(self, event):
+        # a full redraw happened: recapture the background and put the playhead back
+        # (drawn into the renderer only, the canvas repaints after the draw)
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.ax.draw_artist(self.line_cur)
+    
+    def redraw(self):
+        # coalesced full redraw, the background is recaptured in _on_draw
+        self.background = None
+        self.canvas.draw_idle()
+    
+    def _update_xlim(self, cur_frame):
+        # scroll by whole pages so the background only changes when the playhead leaves it
+        if self.is_full_size:
+            xlim = (0, self.total_frames)
+        else:
+            if (self.window_start is None or 
+                not (self.window_start <= cur_frame < self.window_start + 2*self.local_width)):
+                self.window_start = cur_frame - self.local_width // 2
+            xlim = (self.window_start, self.window_start + 2*self.local_width)
+        
+        if tuple(self.ax.get_xlim()) == xlim:
+            return False
+        self.ax.set_xlim(*xlim)
+        return True
         
     def set_total_frames(self, total_frames):
         self.total_frames = total_frames
         self.local_width = 100
+        self.window_start = None
         self.move_indicator(0)
         
     def move_indicator(self, cur_frame):
-        # Update the x-axis limits to show the current frame
-        if self.is_full_size:
-            self.ax.set_xlim(0, self.total_frames)
-        else:
-            self.ax.set_xlim(cur_frame-self.local_width, cur_frame+self.local_width)
+        self.cur_frame = cur_frame
+        if self.figure is None:
+            return # only the latest position is kept, init_ui draws it
         self.line_cur.set_xdata([cur_frame, cur_frame])
-        self.canvas.draw()
+        if self._update_xlim(cur_frame) or self.background is None:
+            self.redraw()
+            return
         
+        # only the playhead moved: blit it over the cached background
+        with tracer.span("timeline.blit"):
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line_cur)
+            self.canvas.blit(self.figure.bbox)
+        
+    @_after_init
     def show_full_size(self, is_full_size=True):
         self.is_full_size = is_full_size
+        self.window_start = None
+        self.move_indicator(self.cur_frame)
         
+    @_after_init
     def add_behavior(self, event_dict):
         behav_name = event_dict["name"]
         behav_color = event_dict["color"]
@@ -70,18 +149,68 @@ class BehaviorPlotWidget(QWidget):
         self.line_behavs[behav_name], = self.ax.plot(xdata, ydata, ".-", lw=1, color=behav_color)
         self.ax.set_ylim([-0.5, len(self.line_behavs)+0.5])
         self.ax.set_yticks(range(len(self.line_behavs)), labels=list(self.line_behavs.keys()))
-        self.canvas.draw()
+        self.redraw()
+    
+    @_after_init
+    def clear_behaviors(self):
+        for line in self.line_behavs.values():
+            line.remove()
+        self.line_behavs = {}
+        self.ax.set_ylim([-0.5, 1.5])
+        self.ax.set_yticks([])
+        self.redraw()
+    
+    @_after_init
+    def set_frames(self, event_dict):
+        # replace all the bouts of a behavior at once (name, starts, ends)
+        line = self.line_behavs[event_dict["name"]]
+        nbehav = line.get_ydata()[0]
+        num_bouts = len(event_dict["starts"])
+        
+        xdata = np.full((num_bouts + 1, 3), np.nan)
+        xdata[1:, 0] = event_dict["starts"]
+        xdata[1:, 1] = event_dict["ends"]
+        ydata = np.full((num_bouts + 1, 3), np.nan)
+        ydata[:, :2] = nbehav
+        line.set_xdata(xdata.ravel())
+        line.set_ydata(ydata.ravel())
+        self.redraw()
     
+    @_after_init
     def add_frame(self, event_dict):
+        line = self.line_behavs[event_dict["name"]]
+        frame_range = sorted([event_dict["start_frame"], event_dict["end_frame"]])
+        nbehav = line.get_ydata()[0]
+        
+        # appended as a [start, end, nan] triple for the next full redraw
+        line.set_data(np.append(line.get_xdata(), frame_range + [np.nan]),
+                      np.append(line.get_ydata(), [nbehav, nbehav, np.nan]))
+        if self.background is None:
+            self.redraw()
+            return
+        
+        # only the new bout changed: draw it into the cached background
+        self.line_new.set_data(frame_range, [nbehav, nbehav])
+        self.line_new.set_color(line.get_color())
+        with tracer.span("timeline.blit"):
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line_new)
+            self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+            self.ax.draw_artist(self.line_cur)
+            self.canvas.blit(self.figure.bbox)
+    
+    @_after_init
+    def remove_frame(self, event_dict):
         behav_name = event_dict["name"]
         frame_range = [event_dict["start_frame"], event_dict["end_frame"]]
         
-        xdata = self.line_behavs[behav_name].get_xdata()
-        ydata = self.line_behavs[behav_name].get_ydata()
-        
-        xdata = list(xdata) + frame_range + [np.nan]
-        ydata = list(ydata) + [ydata[0], ydata[0], np.nan]
+        # each bout is a [start, end, nan] triple of the line data
+        xdata = np.asarray(self.line_behavs[behav_name].get_xdata(), dtype=float).reshape(-1, 3)
+        ydata = np.asarray(self.line_behavs[behav_name].get_ydata(), dtype=float).reshape(-1, 3)
+        match = np.flatnonzero((xdata[:, 0] == frame_range[0]) & (xdata[:, 1] == frame_range[1]))
+        if match.size == 0:
+            return
         
-        self.line_behavs[behav_name].set_xdata(xdata)
-        self.line_behavs[behav_name].set_ydata(ydata)
-        self.canvas.draw()
\ No newline at end of file
+        self.line_behavs[behav_name].set_xdata(np.delete(xdata, match[0], axis=0).ravel())
+        self.line_behavs[behav_name].set_ydata(np.delete(ydata, match[0], axis=0).ravel())
+        self.redraw()
\ No newline at end of file
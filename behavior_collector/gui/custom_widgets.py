@@ -1,2 +1,78 @@
-from PyQt5.QtWidgets import QPushButton
+from PyQt5.QtWidgets import QPushButton, QSlider, QLabel, QStyle, QStyleOptionSlider
+from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtCore import Qt, QPoint
 
+HAS_BGR888 = hasattr(QImage, "Format_BGR888") # Qt >= 5.14
+PREVIEW_MARGIN = 4 # pixels between the preview and the slider
+
+
+class ThumbnailSlider(QSlider):
+    """
+    Slider that previews the frame under the cursor while hovered or dragged.
+
+    The preview comes from a ThumbnailIndex, so it is shown without decoding
+    anything; seeking still happens when the slider is released.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.thumbnails = None
+        self.setMouseTracking(True)
+
+        self.preview = QLabel(self, Qt.ToolTip)
+        self.preview.setAlignment(Qt.AlignCenter)
+        self.preview.hide()
+        self.sliderMoved.connect(self._preview_handle)
+        self.sliderReleased.connect(self.preview.hide)
+
+    def set_thumbnails(self, thumbnails):
+        self.thumbnails = thumbnails
+        self.preview.hide()
+
+    def _geometry(self):
+        option = QStyleOptionSlider()
+        self.initStyleOption(option)
+        groove = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderGroove, self)
+        handle = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderHandle, self)
+        return groove.x() + handle.width() // 2, groove.width() - handle.width()
+
+    def value_at(self, x):
+        x0, span = self._geometry()
+        return QStyle.sliderValueFromPosition(self.minimum(), self.maximum(), x - x0, span)
+
+    def position_of(self, value):
+        x0, span = self._geometry()
+        return x0 + QStyle.sliderPositionFromValue(self.minimum(), self.maximum(), value, span)
+
+    def show_preview(self, value, x):
+        found = self.thumbnails.get(value) if self.thumbnails is not None else None
+        if found is None:
+            self.preview.hide()
+            return
+        _, thumb = found
+        h, w, _ = thumb.shape
+        if HAS_BGR888:
+            image = QImage(thumb.data, w, h, thumb.strides[0], QImage.Format_BGR888)
+        else:
+            import cv2
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2RGB)
+            image = QImage(thumb.data, w, h, thumb.strides[0], QImage.Format_RGB888)
+        self.preview.setPixmap(QPixmap.fromImage(image)) # copies the thumbnail
+        self.preview.adjustSize()
+
+        pos = self.mapToGlobal(QPoint(x - self.preview.width() // 2,
+                                      -self.preview.height() - PREVIEW_MARGIN))
+        self.preview.move(pos)
+        self.preview.show()
+
+    def _preview_handle(self, value):
+        self.show_preview(value, self.position_of(value))
+
+    def mouseMoveEvent(self, event):
+        super().mouseMoveEvent(event)
+        if not self.isSliderDown():
+            self.show_preview(self.value_at(event.x()), event.x())
+
+    def leaveEvent(self, event):
+        if not self.isSliderDown():
+            self.preview.hide()
+        super().leaveEvent(event)
@@ -0,0 +1,58 @@
+import threading
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class FrameWorker(QThread):
+    """
+    Decode frames off the GUI thread.
+
+    Only the most recent request is kept: a request that arrives while the
+    worker is busy replaces any request that has not been started yet, so a
+    burst of key presses collapses into a single decode of the last frame.
+    Full-resolution requests (used when zoomed in) are served after regular
+    ones and bypass the reader's display-resolution cache.
+    """
+    frame_ready = pyqtSignal(int, object) # frame number, BGR frame or None if it failed
+
+    def __init__(self, video_reader, parent=None):
+        super().__init__(parent)
+        self.video_reader = video_reader
+        self._pending = None
+        self._pending_full = None
+        self._active = True
+        self._cond = threading.Condition()
+
+    def request(self, nframe):
+        with self._cond:
+            self._pending = nframe
+            self._cond.notify()
+
+    def request_full(self, nframe):
+        with self._cond:
+            self._pending_full = nframe
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._active and self._pending is None and self._pending_full is None:
+                    self._cond.wait()
+                if not self._active:
+                    break
+                full_resolution = self._pending is None
+                if full_resolution:
+                    nframe, self._pending_full = self._pending_full, None
+                else:
+                    nframe, self._pending = self._pending, None
+
+            if full_resolution:
+                frame = self.video_reader.read_full_frame(nframe)
+            else:
+                frame = self.video_reader.move_specific_frame(nframe)
+            self.frame_ready.emit(nframe, frame) # None is passed on, the request is answered
+
+    def stop(self):
+        with self._cond:
+            self._active = False
+            self._cond.notify()
+        self.wait()
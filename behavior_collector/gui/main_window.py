@@ -1,27 +1,45 @@
+import os
 import sys
-from PyQt5.QtWidgets import QApplication, QHBoxLayout, QVBoxLayout, QWidget
+from PyQt5.QtWidgets import QApplication, QHBoxLayout, QVBoxLayout, QGridLayout, QWidget
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QEvent
 # from .video_panel import VideoPanel
 # from .video_panel import VideoPanel
 
 from behavior_collector.gui.video_panel import VideoPanel
 from behavior_collector.gui.video_panel import MOVE_FORWARD, MOVE_BACKWARD, TOGGLE_PLAY
 from behavior_collector.gui.video_control import VideoController
+from behavior_collector.gui.playback_coordinator import PlaybackCoordinator
 from behavior_collector.gui.behavior_panel import BehaviorPanel
 from behavior_collector.gui.behavior_panel import pyqt_KEY_MAP
 from behavior_collector.gui.utils_gui import error2messagebox, print_keypress
+from behavior_collector.gui.perf_hud import PerfHud
+from behavior_collector.processing.session_state import save_state
+from behavior_collector.processing.playback_clock import PLAYBACK_SPEEDS
 
 
 IMAGE_BUFFER_SIZE = 200
+MAX_VIDEOS = 8
 
 
 class MainWindow(QWidget):
-    def __init__(self):
+    def __init__(self, timeline="matplotlib", num_videos=2, decode_workers=None,
+                 disk_cache=None, session_file=None, decoder="auto"):
         super().__init__()
+        if not (1 <= num_videos <= MAX_VIDEOS):
+            raise ValueError(f"Number of videos must be between 1 and {MAX_VIDEOS}")
+        self.timeline = timeline
+        self.num_videos = num_videos
+        if decode_workers is None:
+            # spare cores shared between the streams, one is left for the GUI
+            decode_workers = ((os.cpu_count() or 1) - 1) // num_videos
+        self.decode_workers = decode_workers
+        self.disk_cache = disk_cache # DiskFrameCache of decoded frames, or None
+        self.decoder = decoder # decoder backend of the videos, "auto" to probe each file
+        self.session_file = session_file # state saved on close, None to not save it
         
+        # shown by the caller once the widgets exist
         self.setWindowTitle("Behavior Detection Tool")
-        self.showFullScreen()
         
         font = QFont("Arial", 12)
         self.setFont(font)
@@ -29,34 +47,85 @@ class MainWindow(QWidget):
         self.init_ui()
         
     def init_ui(self):
-        layout = QHBoxLayout()
+        layout = QVBoxLayout()
         
-        # Left side
-        layout_l = QVBoxLayout()
-        video_panel_l = VideoPanel()
-        layout_l.addWidget(video_panel_l, stretch=4)
+        # videos, the first one is annotated and drives the controller
+        layout_videos = QGridLayout()
+        num_cols = self.num_videos if self.num_videos <= 2 else (self.num_videos + 1) // 2
+        self.video_panels = []
+        for i in range(self.num_videos):
+            video_panel = VideoPanel(decode_workers=self.decode_workers, build_thumbnails=(i == 0),
+                                     disk_cache=self.disk_cache, decoder=self.decoder)
+            layout_videos.addWidget(video_panel, i // num_cols, i % num_cols)
+            self.video_panels.append(video_panel)
+        video_panel_main = self.video_panels[0]
         
-        self.control_panel = VideoController("Video Control")
-        layout_l.addWidget(self.control_panel, stretch=1)
+        self.control_panel = VideoController("Video Control", timeline=self.timeline)
+        self.control_panel.connect_video(video_panel_main)
         
-        self.control_panel.connect_video(video_panel_l)
-        video_panel_l.connect_controller(self.control_panel)
-        
-        # right side        
-        layout_r = QVBoxLayout()
-        video_panel_r = VideoPanel()
-        layout_r.addWidget(video_panel_r, stretch=4)
-
-        video_panel_r.connect_controller(self.control_panel)
+        # all the streams follow the controller through a shared clock
+        self.coordinator = PlaybackCoordinator(self.video_panels, parent=self)
+        self.coordinator.connect_controller(self.control_panel)
         
         self.behavior_panel = BehaviorPanel("Behavior Control")
-        layout_r.addWidget(self.behavior_panel, stretch=1)
-        self.behavior_panel.connect_video(video_panel_l)
+        self.behavior_panel.connect_video(video_panel_main)
         self.behavior_panel.connect_control(self.control_panel)
         
-        layout.addLayout(layout_l)
-        layout.addLayout(layout_r)
+        layout_bottom = QHBoxLayout()
+        layout_bottom.addWidget(self.control_panel)
+        layout_bottom.addWidget(self.behavior_panel)
+        
+        layout.addLayout(layout_videos, stretch=4)
+        layout.addLayout(layout_bottom, stretch=1)
         self.setLayout(layout)
+        
+        # performance overlay, toggled with F3
+        self.perf_hud = PerfHud(self.video_panels, parent=self)
+    
+    def session_state(self):
+        return {
+            "videos": [video_panel.session_state() for video_panel in self.video_panels],
+            "frame": self.control_panel.getFrame(),
+            "speed": self.control_panel.play_clock.speed,
+            "step": self.control_panel.comb_step.currentIndex(),
+            "full_summary": self.control_panel.check_full_behav.isChecked(),
+            "annotation_file": self.behavior_panel.annotation_file,
+        }
+    
+    def restore_session(self, state):
+        # reopen what the previous session showed, skipping files that are gone
+        for video_panel, video in zip(self.video_panels, state.get("videos", [])):
+            if video and os.path.exists(video["path"]):
+                video_panel.restore_session(video)
+        
+        annotation_file = state.get("annotation_file")
+        if annotation_file and os.path.exists(annotation_file):
+            self.behavior_panel.annotation_file = annotation_file
+            behav_set = self.behavior_panel.behav_set
+            if behav_set is not None and not behav_set.behav_info:
+                # nothing journaled for this video: start from the annotation file
+                self.behavior_panel.load_annotation(annotation_file)
+        
+        control_panel = self.control_panel
+        if state.get("speed") in PLAYBACK_SPEEDS:
+            control_panel.comb_speed.setCurrentIndex(PLAYBACK_SPEEDS.index(state["speed"]))
+        if 0 <= state.get("step", -1) < control_panel.comb_step.count():
+            control_panel.comb_step.setCurrentIndex(state["step"])
+        if state.get("full_summary"):
+            control_panel.check_full_behav.setChecked(True)
+            control_panel.behav_plot_panel.show_full_size(True)
+        if 0 < state.get("frame", 0) < control_panel.total_frames:
+            control_panel.setFrame(frame=state["frame"])
+    
+    def closeEvent(self, event):
+        if self.session_file is not None:
+            save_state(self.session_state(), self.session_file)
+        for video_panel in self.video_panels:
+            video_panel.close_video()
+        self.behavior_panel.close_session()
+        if self.disk_cache is not None:
+            self.disk_cache.close()
+        super().closeEvent(event)
     
     @print_keypress("main window", debug=True)
     @error2messagebox(to_warn=True)
@@ -69,10 +138,22 @@ class MainWindow(QWidget):
             pass
         elif event.key() == Qt.Key_Escape:
             self.close()
+        elif event.key() == Qt.Key_F3:
+            self.perf_hud.toggle()
         elif event.key() in pyqt_KEY_MAP.keys():
             self.behavior_panel.add_frame(event.key())
         else: # Q,W,E,R,T,A,S,D,F
             pass
+    
+    def keyReleaseEvent(self, event=None):
+        if event.key() in (Qt.Key_L, Qt.Key_K):
+            self.control_panel.keyReleaseEvent(event)
+    
+    def changeEvent(self, event):
+        # a key released in another window never reaches us
+        if event.type() == QEvent.ActivationChange and not self.isActiveWindow():
+            self.control_panel.stop_key_repeat()
+        super().changeEvent(event)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+import time
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt, QTimer
+
+from ..processing.tracing import tracer
+
+HUD_REFRESH_MS = 500
+HUD_MARGIN = 8 # px from the top-left corner of the window
+
+
+class PerfHud(QLabel):
+    """
+    Overlay with the presented fps, the end-to-end frame latency, the reader
+    cache hit rate and the p50/p99 of every traced stage. The rates cover the
+    last refresh interval, the percentiles the recent samples of the tracer.
+    """
+    def __init__(self, video_panels, parent=None):
+        super().__init__(parent)
+        self.video_panels = video_panels
+        self.last = None # (time, presented frames, cache hits, cache misses) at the last refresh
+
+        font = QFont("Monospace", 9)
+        font.setStyleHint(QFont.TypeWriter)
+        self.setFont(font)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: white; padding: 6px;")
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setTextFormat(Qt.PlainText)
+        self.hide()
+
+        self.timer_refresh = QTimer(self)
+        self.timer_refresh.timeout.connect(self.refresh)
+
+    def toggle(self):
+        if self.isVisible():
+            self.timer_refresh.stop()
+            self.hide()
+            return
+        self.last = None
+        self.refresh()
+        self.show()
+        self.raise_()
+        self.timer_refresh.start(HUD_REFRESH_MS)
+
+    def _counters(self):
+        hits = misses = disk_hits = 0
+        for video_panel in self.video_panels:
+            reader = video_panel.video_reader
+            stats = getattr(reader, "stats", None)
+            if stats is not None:
+                hits += stats.hits
+                misses += stats.misses
+                disk_hits += stats.disk_hits
+        return time.perf_counter(), tracer.count("frame.present"), hits, misses, disk_hits
+
+    def refresh(self):
+        now, presented, hits, misses, disk_hits = counters = self._counters()
+        summary = tracer.summary()
+        lines = []
+        if self.last is not None:
+            dt = now - self.last[0]
+            fetches = (hits - self.last[2]) + (misses - self.last[3])
+            lines.append("presented  %6.1f fps"%((presented - self.last[1]) / dt))
+            lines.append("cache hits %s  disk %d"%(
+                "%5.1f %%"%(100 * (hits - self.last[2]) / fetches) if fetches > 0 else "    -  ",
+                disk_hits - self.last[4]))
+        self.last = counters
+
+        latency = summary.get("frame.latency", {})
+        if latency.get("count"):
+            lines.append("latency    p50 %.1f ms  p99 %.1f ms"%(latency["p50_ms"], latency["p99_ms"]))
+        lines.append("")
+        lines.append("%-18s %8s %8s %8s"%("stage", "p50 ms", "p99 ms", "count"))
+        for stage, stats in summary.items():
+            if stats.get("count"):
+                lines.append("%-18s %8.2f %8.2f %8d"%(stage, stats["p50_ms"], stats["p99_ms"],
+                                                      stats["count"]))
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        self.move(HUD_MARGIN, HUD_MARGIN)
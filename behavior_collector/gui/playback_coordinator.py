@@ -0,0 +1,159 @@
+import time
+from functools import partial
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from ..processing.stream_clock import StreamClock
+from ..processing.playback_clock import prefetch_stride
+from ..processing.tracing import tracer
+from .video_control import VideoController, NULL_SIGNAL
+
+PRESENT_TIMEOUT_MS = 150 # show the streams that are ready if another one lags
+
+
+class PlaybackCoordinator(QObject):
+    """
+    Drive several VideoPanels from the controller's master frame.
+
+    The master frame is mapped to each stream's frame through a StreamClock
+    (frame times and per-stream offset). All the streams are requested at once,
+    each panel decoding on its own worker thread, and the frames are put on
+    screen together once every stream has delivered the frame for the current
+    instant (or after PRESENT_TIMEOUT_MS). The first panel is the master: the
+    controller and the annotations count its frames.
+
+    During fast playback each stream is only asked for frames on its
+    prefetch stride grid, and its reader skips the frames in between.
+    """
+    frame_presented = pyqtSignal(int) # master frame put on screen, -1 if none was ready
+    
+    def __init__(self, video_panels, parent=None):
+        super().__init__(parent)
+        self.video_panels = video_panels
+        self.clock = StreamClock(master_key=0)
+        self.master_frame = 0
+        self.speed = 0 # playback speed, 0 when paused
+
+        self.targets = {} # stream -> frame shown at this instant (None: no frame)
+        self.pending = {} # stream -> frame still being decoded for this instant
+        self.ready = {} # stream -> (frame number, frame) waiting to be shown
+        self.presented = True
+        self.seek_time = None # perf_counter() of the seek being served
+
+        self.timer_present = QTimer(self)
+        self.timer_present.setSingleShot(True)
+        self.timer_present.timeout.connect(self.present)
+
+        for stream, video_panel in enumerate(video_panels):
+            video_panel.synchronized = True
+            video_panel.file_selected.connect(partial(self.add_stream, stream))
+            video_panel.video_closed.connect(partial(self.remove_stream, stream))
+            video_panel.frame_decoded.connect(partial(self.receive_frame, stream))
+            video_panel.offset_changed.connect(partial(self.set_offset, stream))
+
+    def connect_controller(self, controller: VideoController):
+        controller.signal_move_frame.connect(self.update_frame)
+        controller.signal_speed_changed.connect(self.set_playback_speed)
+        self.frame_presented.connect(controller.frame_presented)
+
+    def add_stream(self, stream, fileinfo):
+        video_panel = self.video_panels[stream]
+        self.clock.add_stream(stream, fileinfo["fps"], fileinfo["total_frames"],
+                              video_panel.offset(), fileinfo.get("timestamps"))
+        if stream == self.clock.master_key:
+            self.master_frame = 0
+        self._share_cache_budget()
+        self.set_playback_speed(self.speed)
+        self.seek(self.master_frame)
+
+    def remove_stream(self, stream):
+        self.clock.remove_stream(stream)
+        self.targets.pop(stream, None)
+        self.pending.pop(stream, None)
+        self.ready.pop(stream, None)
+        self._share_cache_budget()
+
+    def _share_cache_budget(self):
+        # keep the total decoded-frame cache constant however many streams are open
+        from ..processing.video_reader import CACHE_BUDGET
+        readers = [panel.video_reader for panel in self.video_panels
+                   if panel.video_reader is not None]
+        for reader in readers:
+            reader.set_cache_budget(CACHE_BUDGET // len(readers))
+
+    def _stride(self, stream):
+        if not self.speed:
+            return 1
+        return prefetch_stride(self.clock.streams[stream].fps, self.speed)
+
+    def set_playback_speed(self, speed):
+        self.speed = speed
+        for stream in self.clock.streams:
+            self.video_panels[stream].video_reader.set_prefetch_stride(self._stride(stream))
+
+    def set_offset(self, stream, offset):
+        if stream in self.clock.streams:
+            self.clock.set_offset(stream, offset)
+            self.seek(self.master_frame)
+
+    def update_frame(self, frame, dframe):
+        if frame == NULL_SIGNAL and dframe == NULL_SIGNAL:
+            return
+        if frame == NULL_SIGNAL:
+            frame = self.master_frame + dframe
+        self.seek(frame)
+
+    def seek(self, master_frame):
+        if not self.presented:
+            # a stream is lagging behind (e.g. fast playback): show the ones
+            # that are ready rather than holding them all back
+            self.present()
+        
+        self.master_frame = master_frame
+        self.seek_time = time.perf_counter()
+        self.targets = self.clock.frames_at(master_frame)
+        self.pending = {}
+        self.ready = {}
+        self.presented = False
+
+        for stream, nframe in self.targets.items():
+            video_panel = self.video_panels[stream]
+            if nframe is not None:
+                nframe -= nframe % self._stride(stream)
+                self.targets[stream] = nframe
+            if nframe is None:
+                self.ready[stream] = (None, None) # stream not running at this instant
+            elif nframe != video_panel.shown_frame:
+                self.pending[stream] = nframe
+                video_panel.update_specific_frame(nframe)
+
+        if self.pending:
+            self.timer_present.start(PRESENT_TIMEOUT_MS)
+        else:
+            self.present()
+
+    def receive_frame(self, stream, nframe, frame):
+        # frame None: decoding failed, the stream keeps its picture
+        if self.presented:
+            # late frame (or a full-resolution one) for the instant on screen
+            if self.targets.get(stream) == nframe and frame is not None:
+                self.video_panels[stream].present_frame(nframe, frame)
+            return
+        if self.pending.get(stream) != nframe:
+            return
+        del self.pending[stream]
+        if frame is not None:
+            self.ready[stream] = (nframe, frame)
+        if not self.pending:
+            self.present()
+
+    def present(self):
+        self.timer_present.stop()
+        with tracer.span("frame.present"):
+            for stream, (nframe, frame) in self.ready.items():
+                self.video_panels[stream].present_frame(nframe, frame)
+        if self.ready and self.seek_time is not None:
+            # from the seek request to all the frames on screen
+            tracer.record("frame.latency", self.seek_time, time.perf_counter())
+        self.frame_presented.emit(self.master_frame if self.ready else -1)
+        self.ready = {}
+        self.presented = True
@@ -0,0 +1,191 @@
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QSizePolicy
+from PyQt5.QtGui import QPainter, QPixmap, QColor, QPen
+from PyQt5.QtCore import Qt, QRect, QRectF
+
+from ..processing.interval_index import IntervalIndex
+from ..processing.tracing import tracer
+
+
+LABEL_WIDTH = 100 # px reserved for the behavior names
+BAR_HEIGHT = 0.6 # fraction of a row covered by a bout
+INDICATOR_WIDTH = 2 # px
+
+
+class BehaviorTimelineWidget(QWidget):
+    """
+    QPainter-based timeline with the same interface as BehaviorPlotWidget.
+
+    Bouts are kept in a per-behavior IntervalIndex. Only the bouts inside the
+    visible range are drawn, and when there are more bouts than pixels they
+    are merged per pixel column, so the cost of a redraw is bounded by the
+    widget width rather than by the number of annotations. The tracks are
+    rendered into a cached pixmap; moving the playhead only repaints the line.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.is_full_size = False
+        self.local_width = 100
+        self.total_frames = 1
+        self.cur_frame = 0
+        self.window_start = None
+
+        self.behav_names = []
+        self.behav_colors = {}
+        self.behav_bouts = {}
+        self._background = None
+
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setMinimumHeight(60)
+
+    def set_total_frames(self, total_frames):
+        self.total_frames = total_frames
+        self.local_width = 100
+        self.window_start = None
+        self.move_indicator(0)
+
+    def visible_range(self):
+        if self.is_full_size or self.window_start is None:
+            return 0, max(self.total_frames, 1)
+        return self.window_start, self.window_start + 2*self.local_width
+
+    def _indicator_rect(self, nframe):
+        # columns covered by the indicator line at nframe
+        x = int(self._frame_to_x(nframe))
+        return QRect(x - INDICATOR_WIDTH, 0, 2 * INDICATOR_WIDTH + 1, self.height())
+
+    def move_indicator(self, cur_frame):
+        prev_frame = self.cur_frame
+        self.cur_frame = cur_frame
+        if not self.is_full_size:
+            start, end = self.visible_range()
+            if self.window_start is None or not (start <= cur_frame < end):
+                self.window_start = cur_frame - self.local_width // 2
+                self._background = None
+        if self._background is None:
+            self.update()
+            return
+        # the tracks are unchanged: repaint the old and the new line only
+        self.update(self._indicator_rect(prev_frame))
+        self.update(self._indicator_rect(cur_frame))
+
+    def show_full_size(self, is_full_size=True):
+        self.is_full_size = is_full_size
+        self.window_start = None
+        self._background = None
+        self.move_indicator(self.cur_frame)
+
+    def add_behavior(self, event_dict):
+        behav_name = event_dict["name"]
+        self.behav_names.append(behav_name)
+        self.behav_colors[behav_name] = QColor(event_dict["color"])
+        self.behav_bouts[behav_name] = IntervalIndex()
+        self._background = None
+        self.update()
+
+    def clear_behaviors(self):
+        self.behav_names = []
+        self.behav_colors = {}
+        self.behav_bouts = {}
+        self._background = None
+        self.update()
+
+    def set_frames(self, event_dict):
+        # replace all the bouts of a behavior at once (name, starts, ends)
+        self.behav_bouts[event_dict["name"]] = IntervalIndex.from_arrays(event_dict["starts"],
+                                                                         event_dict["ends"])
+        self._background = None
+        self.update()
+
+    def add_frame(self, event_dict):
+        start_frame = min(event_dict["start_frame"], event_dict["end_frame"])
+        end_frame = max(event_dict["start_frame"], event_dict["end_frame"])
+        self.behav_bouts[event_dict["name"]].insert(start_frame, end_frame)
+        self._invalidate_range(start_frame, end_frame)
+
+    def remove_frame(self, event_dict):
+        start_frame = min(event_dict["start_frame"], event_dict["end_frame"])
+        end_frame = max(event_dict["start_frame"], event_dict["end_frame"])
+        index = self.behav_bouts[event_dict["name"]]
+        i = index.index_of(start_frame, end_frame)
+        if i >= 0:
+            index.remove(i)
+            self._invalidate_range(start_frame, end_frame)
+
+    def _invalidate_range(self, start_frame, end_frame):
+        start, end = self.visible_range()
+        if start_frame <= end and end_frame >= start:
+            self._background = None
+            self.update()
+
+    def resizeEvent(self, event):
+        self._background = None
+        super().resizeEvent(event)
+
+    def _frame_to_x(self, nframe):
+        start, end = self.visible_range()
+        plot_width = max(self.width() - LABEL_WIDTH, 1)
+        return LABEL_WIDTH + (nframe - start) * plot_width / (end - start)
+
+    def _bout_pixels(self, behav_name, plot_width):
+        # [x0, x1) pixel spans of the visible bouts, merged per pixel column
+        # when there are more bouts than pixels
+        start, end = self.visible_range()
+        starts, ends = self.behav_bouts[behav_name].query(start, end)
+        if len(starts) == 0:
+            return starts, ends
+
+        frames_per_pixel = (end - start) / plot_width
+        x0 = ((np.maximum(starts, start) - start) / frames_per_pixel).astype(np.int64)
+        x1 = ((np.minimum(ends + 1, end) - start) / frames_per_pixel).astype(np.int64)
+        x1 = np.clip(np.maximum(x1, x0 + 1), 0, plot_width)
+        if len(x0) <= plot_width:
+            return x0, x1
+
+        coverage = (np.bincount(x0, minlength=plot_width + 1)
+                    - np.bincount(x1, minlength=plot_width + 1))
+        covered = np.cumsum(coverage)[:plot_width] > 0
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], covered.view(np.int8), [0]))))
+        return edges[0::2], edges[1::2]
+
+    @tracer.traced("timeline.draw")
+    def _render_tracks(self):
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(self.palette().color(self.backgroundRole()))
+
+        painter = QPainter(pixmap)
+        num_rows = max(len(self.behav_names), 1)
+        row_height = self.height() / num_rows
+        plot_width = max(self.width() - LABEL_WIDTH, 1)
+
+        for row, behav_name in enumerate(self.behav_names):
+            top = row * row_height
+            bar_top = top + row_height * (1 - BAR_HEIGHT) / 2
+            bar_height = row_height * BAR_HEIGHT
+
+            painter.setPen(self.palette().color(self.foregroundRole()))
+            painter.drawText(QRectF(0, top, LABEL_WIDTH - 4, row_height),
+                             Qt.AlignRight | Qt.AlignVCenter, behav_name)
+
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(self.behav_colors[behav_name])
+            for x0, x1 in zip(*self._bout_pixels(behav_name, plot_width)):
+                painter.drawRect(QRectF(LABEL_WIDTH + x0, bar_top, x1 - x0, bar_height))
+        painter.end()
+        return pixmap
+
+    @tracer.traced("timeline.paint")
+    def paintEvent(self, event):
+        if self._background is None:
+            self._background = self._render_tracks()
+
+        painter = QPainter(self)
+        painter.setClipRect(event.rect())
+        painter.drawPixmap(0, 0, self._background)
+
+        x = self._frame_to_x(self.cur_frame)
+        painter.setPen(QPen(Qt.black, INDICATOR_WIDTH))
+        painter.drawLine(int(x), 0, int(x), self.height())
+        painter.end()
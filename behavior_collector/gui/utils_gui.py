@@ -1,7 +1,10 @@
 from PyQt5.QtWidgets import QColorDialog, QWidget, QMessageBox
 from PyQt5.QtGui import QColor, QPainter
-from PyQt5.QtCore import Qt, QSize
-import traceback
+from PyQt5.QtCore import Qt, QSize, QObject, QEvent
+
+from ..processing.tracing import get_logger
+
+logger = get_logger("gui")
 
 
 class ColorPicker(QWidget):
@@ -35,14 +38,27 @@ class ColorPicker(QWidget):
             self.update()
             
     
+class FirstPaint(QObject):
+    # calls callback once, when the watched widget is first painted
+    def __init__(self, widget, callback):
+        super().__init__(widget)
+        self.callback = callback
+        widget.installEventFilter(self)
+        
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            self.callback()
+        return False
+
+
 def error2messagebox(to_warn=False):
     def decorator(func):
         def wrapper(*args, **kwargs):
             try:
                 return func(*args, **kwargs)
             except Exception as e:
-                print(traceback.format_exc())
-                print(e)
+                logger.exception(e)
                 if to_warn:
                     QMessageBox.warning(None, "Warning", str(e))
                 else:
@@ -56,7 +72,7 @@ def print_keypress(message, debug=False):
     def decorator(func):
         def wrapper(self, event):
             if debug:
-                print(f"Key pressed in {message}: key: {event.key()}")
+                logger.debug("Key pressed in %s: key: %d", message, event.key())
             return func(self, event)
         return wrapper
     return decorator
\ No newline at end of file
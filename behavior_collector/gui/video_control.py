@@ -1,28 +1,49 @@
 from PyQt5.QtWidgets import (
-    QWidget, QGroupBox, QVBoxLayout, QHBoxLayout, QSpinBox, QLabel, QSlider, QDoubleSpinBox,
-    QCheckBox
+    QWidget, QGroupBox, QVBoxLayout, QHBoxLayout, QSpinBox, QLabel, QDoubleSpinBox,
+    QCheckBox, QComboBox
 )
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer
+from importlib import import_module
 
 from .utils_gui import print_keypress
-from .behavior_summary_scene import BehaviorPlotWidget
-from functools import partial
+from .custom_widgets import ThumbnailSlider
+from ..processing.playback_clock import PlaybackClock, PLAYBACK_SPEEDS
+from ..processing.key_repeat import KeyRepeat, STEP_SIZES, step_frames
+from ..processing.tracing import get_logger
 
 MOVE_FORWARD = 1
 MOVE_BACKWARD = -1
 NULL_SIGNAL = -10000
+TICKS_PER_FRAME = 2 # the play timer samples the clock twice per shown frame
+FPS_REFRESH_MS = 500
+KEY_TICK_MS = 16 # held navigation keys are sampled once per display refresh
+
+logger = get_logger("video_control")
+
+TIMELINE_WIDGETS = { # name -> (module, class), imported when used
+    "matplotlib": (".behavior_summary_scene", "BehaviorPlotWidget"),
+    "native": (".timeline_widget", "BehaviorTimelineWidget"),
+}
+
+
+def timeline_widget_class(timeline):
+    module, name = TIMELINE_WIDGETS[timeline]
+    return getattr(import_module(module, __package__), name)
 
 
 class VideoController(QGroupBox):
     
     signal_move_frame = pyqtSignal(int, int)
+    signal_speed_changed = pyqtSignal(float) # playback speed, 0 when paused
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, timeline="matplotlib", **kwargs):
         super().__init__(*args, **kwargs)
+        self.timeline = timeline
         self.total_frames = 1
         self.total_times = 0
         self.behav_plot_panel = None
         self.fps = 1
+        self.timestamps = None # TimestampIndex of the video, frame / fps without it
         
         self.setFixedHeight(300)
         self.init_ui()
@@ -32,7 +53,7 @@ class VideoController(QGroupBox):
         layout = QVBoxLayout()
         
         # self.behav_plot_panel = BehaviorSummary()
-        self.behav_plot_panel = BehaviorPlotWidget()
+        self.behav_plot_panel = timeline_widget_class(self.timeline)()
         layout2 = self.init_control_box()
         
         layout.addWidget(self.behav_plot_panel)
@@ -41,8 +62,20 @@ class VideoController(QGroupBox):
         
     def init_player(self):
         self.is_playing = False
+        self.frame_pending = False # a played frame is not on screen yet
+        self.play_clock = PlaybackClock(self.fps)
         self.timer_play = QTimer() # toggle play
-        self.timer_play.timeout.connect(partial(self.play_frame, MOVE_FORWARD))
+        self.timer_play.setTimerType(Qt.PreciseTimer)
+        self.timer_play.timeout.connect(self.play_tick)
+        
+        self.timer_fps = QTimer()
+        self.timer_fps.timeout.connect(self.update_fps_label)
+        
+        # held L/K keys: one target frame per refresh instead of one seek per auto-repeat
+        self.key_repeat = KeyRepeat()
+        self.timer_key = QTimer()
+        self.timer_key.setTimerType(Qt.PreciseTimer)
+        self.timer_key.timeout.connect(self.key_tick)
         
     def init_control_box(self):
         
@@ -64,15 +97,28 @@ class VideoController(QGroupBox):
         self.check_full_behav = QCheckBox("Show full summary")
         self.check_full_behav.clicked.connect(_set_full_summary)
         
+        self.comb_speed = QComboBox()
+        self.comb_speed.addItems(["%gx"%(speed) for speed in PLAYBACK_SPEEDS])
+        self.comb_speed.setCurrentIndex(PLAYBACK_SPEEDS.index(1))
+        self.comb_speed.currentIndexChanged.connect(self.update_speed)
+        self.label_fps = QLabel()
+        
+        self.comb_step = QComboBox() # step of the L/K keys
+        self.comb_step.addItems([label for label, _, _ in STEP_SIZES])
+        self.comb_step.setFocusPolicy(Qt.NoFocus) # keep L/K for the main window
+        
         layout1.addWidget(self.dspin_time)
         layout1.addWidget(self.label_time)
         layout1.addWidget(self.spin_frame)
         layout1.addWidget(self.label_frame)
+        layout1.addWidget(self.comb_speed)
+        layout1.addWidget(self.comb_step)
+        layout1.addWidget(self.label_fps)
         layout1.addWidget(self.check_full_behav)
         
         layout.addLayout(layout1)
         
-        self.video_controller = QSlider(Qt.Horizontal, self)
+        self.video_controller = ThumbnailSlider(Qt.Horizontal, self)
         layout.addWidget(self.video_controller)
         self._reset_control_box()
         
@@ -89,9 +135,23 @@ class VideoController(QGroupBox):
         self.file_name = fileinfo_dict["filename"]
         self.total_frames = fileinfo_dict["total_frames"]
         self.fps = fileinfo_dict["fps"]
-        self.total_times = self.total_frames / self.fps
+        self.timestamps = fileinfo_dict.get("timestamps")
+        self.total_times = self.time_of(self.total_frames)
+        self.play_clock.fps = self.fps
+        self.play_clock.timestamps = self.timestamps
+        self.video_controller.set_thumbnails(fileinfo_dict.get("thumbnails"))
         self._reset_control_box()
         self.behav_plot_panel.set_total_frames(self.total_frames)
+    
+    def time_of(self, nframe):
+        if self.timestamps is not None:
+            return self.timestamps.time_of(nframe)
+        return nframe / self.fps
+    
+    def frame_at(self, t):
+        if self.timestamps is not None:
+            return max(self.timestamps.frame_at(t), 0)
+        return int(t * self.fps)
         
     def _reset_control_box(self):
         self.dspin_time.setRange(0, self.total_times)
@@ -106,13 +166,41 @@ class VideoController(QGroupBox):
     
     @print_keypress("video control", debug=True)
     def keyPressEvent(self, event=None):
-        if event.key() == Qt.Key_L: # move forward
-            self.setFrame(dframe=MOVE_FORWARD)
-        elif event.key() == Qt.Key_K: # move backward
-            self.setFrame(dframe=MOVE_BACKWARD)
+        if event.key() in (Qt.Key_L, Qt.Key_K):
+            if not event.isAutoRepeat(): # repeats are taken care of by key_tick
+                direction = MOVE_FORWARD if event.key() == Qt.Key_L else MOVE_BACKWARD
+                self.start_key_repeat(direction)
         elif event.key() == Qt.Key_M: # toggle play
             self.toggle_play()
     
+    def keyReleaseEvent(self, event=None):
+        if event.key() in (Qt.Key_L, Qt.Key_K) and not event.isAutoRepeat():
+            self.stop_key_repeat()
+    
+    def start_key_repeat(self, direction):
+        if self.is_playing:
+            self.toggle_play()
+        self.key_repeat.press(direction, self.getFrame(),
+                              step_frames(self.comb_step.currentIndex(), self.fps))
+        self.frame_pending = False
+        self.key_tick()
+        self.timer_key.start(KEY_TICK_MS)
+    
+    def stop_key_repeat(self):
+        # the frame requested last stays, nothing further is asked for
+        self.timer_key.stop()
+        self.key_repeat.release()
+    
+    def key_tick(self):
+        # move to where the held key has got to by now, unless the previous
+        # target is not on screen yet
+        if self.frame_pending or not self.key_repeat.held:
+            return
+        nframe = min(max(self.key_repeat.target(), 0), self.total_frames - 1)
+        if nframe != self.getFrame():
+            self.frame_pending = True
+            self.setFrame(frame=nframe)
+    
     def setFrame(self, frame: int=None, dframe: int=None):
         if frame is None and dframe is None:
             raise ValueError("Either frame or dframe must be provided")
@@ -126,7 +214,7 @@ class VideoController(QGroupBox):
         
         self.video_controller.setValue(frame)
         self.spin_frame.setValue(frame)
-        self.dspin_time.setValue(frame / self.fps)
+        self.dspin_time.setValue(self.time_of(frame))
         
         if dframe is not None:
             self.signal_move_frame.emit(NULL_SIGNAL, dframe)
@@ -137,18 +225,56 @@ class VideoController(QGroupBox):
     def getFrame(self):
         return self.video_controller.value()
     
-    def play_frame(self, move_type: int):
-        self.setFrame(dframe=move_type)
+    def play_tick(self):
+        # show the frame that is due now. While the previous one is still being
+        # decoded nothing new is requested, so the frames that could not be
+        # shown in time are dropped instead of queued
+        if self.frame_pending:
+            return
+        nframe = self.play_clock.frame()
+        if nframe >= self.total_frames:
+            self.toggle_play()
+            nframe = self.total_frames - 1
+        if nframe != self.getFrame():
+            self.frame_pending = self.is_playing
+            self.setFrame(frame=nframe)
+    
+    def _play_interval(self):
+        return max(int(self.play_clock.tick_interval() * 1000 / TICKS_PER_FRAME), 1)
         
     def toggle_play(self):
         if self.is_playing:
             self.timer_play.stop()
+            self.timer_fps.stop()
+            self.play_clock.stop()
             self.is_playing = False
+            self.frame_pending = False
+            self.signal_speed_changed.emit(0)
         else:
-            interval = int(1000//self.fps) // 2
-            self.timer_play.start(interval)
+            self.play_clock.start(self.getFrame())
+            self.timer_play.start(self._play_interval())
+            self.timer_fps.start(FPS_REFRESH_MS)
             self.is_playing = True
-        print("Toggle play:", self.is_playing)
+            self.signal_speed_changed.emit(self.play_clock.speed)
+        logger.debug("Toggle play: %s", self.is_playing)
+    
+    def update_speed(self, index):
+        self.play_clock.set_speed(PLAYBACK_SPEEDS[index])
+        if self.is_playing:
+            self.timer_play.start(self._play_interval())
+            self.signal_speed_changed.emit(self.play_clock.speed)
+    
+    def frame_presented(self, nframe):
+        # the requested instant was presented, nframe is -1 if no stream had
+        # its frame ready in time
+        self.frame_pending = False
+        if self.is_playing and nframe >= 0:
+            self.play_clock.record_presented(nframe)
+    
+    def update_fps_label(self):
+        self.label_fps.setText("%.1f / %.1f fps (%.2fx)"%(
+            self.play_clock.achieved_fps(), self.play_clock.target_fps(),
+            self.play_clock.achieved_speed()))
         
     @staticmethod
     def update_frame(func):
@@ -170,4 +296,4 @@ class VideoController(QGroupBox):
     @update_frame
     def update_dspin_time_change(self):
         value_time = self.dspin_time.value() # float
-        return int(value_time * self.fps)
+        return min(self.frame_at(value_time), self.total_frames - 1)
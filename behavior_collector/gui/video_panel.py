@@ -1,22 +1,35 @@
 from PyQt5.QtWidgets import (
         QGraphicsScene, QGraphicsView, QVBoxLayout, QHBoxLayout,
         QToolButton, QLabel, QWidget, QFileDialog, QGraphicsPixmapItem,
+        QDoubleSpinBox,
 )
 from PyQt5.QtGui import QPixmap, QImage, QFontMetrics
 from PyQt5.QtCore import Qt, QRectF, QTimer, pyqtSignal
+import numpy as np
 
-
-from ..processing import VideoReader, ThreadVideoReader
+from .frame_worker import FrameWorker
+from ..processing.tracing import tracer, get_logger
 from .video_control import VideoController, MOVE_FORWARD, MOVE_BACKWARD, NULL_SIGNAL
 
 MOVE_FORWARD = 1
 TOGGLE_PLAY = 0
 MOVE_BACKWARD = -1
 
+MEMORY_REFRESH_MS = 1000
+HAS_BGR888 = hasattr(QImage, "Format_BGR888") # Qt >= 5.14
+RESIZE_DEBOUNCE_MS = 200
+MAX_OFFSET = 24 * 3600 # s
+
+logger = get_logger("video_panel")
+
 # TODO: add a full screen check button
 
 
 class ScencePanel(QGraphicsView):
+    
+    viewport_resized = pyqtSignal(int, int) # device pixels
+    zoom_changed = pyqtSignal()
+    
     def __init__(self):
         super().__init__()
         self.initizlied = False
@@ -24,28 +37,105 @@ class ScencePanel(QGraphicsView):
         self._scene = QGraphicsScene()
         self.setScene(self._scene)
         self.setMinimumSize(640, 480)
+        
+        # a single item whose pixmap is swapped for every frame
+        self.pixmap_item = QGraphicsPixmapItem()
+        self._scene.addItem(self.pixmap_item)
+        self._frame_ref = None
+        self._rgb_buf = None # conversion target for Qt < 5.14
+        
+        # scene coordinates are full-resolution pixels, downscaled frames are
+        # shown with a matching item scale
+        self.source_size = None
+        self.pending_view = None # zoom restored once the first frame is fitted
+        self.timer_resize = QTimer(self)
+        self.timer_resize.setSingleShot(True)
+        self.timer_resize.timeout.connect(lambda: self.viewport_resized.emit(*self.viewport_pixels()))
+    
+    def set_source_size(self, width, height):
+        self.source_size = (width, height)
+    
+    def viewport_pixels(self):
+        ratio = self.devicePixelRatioF()
+        size = self.viewport().size()
+        return int(size.width() * ratio), int(size.height() * ratio)
+    
+    def is_undersampled(self, frame_width):
+        # True if a frame of this width is shown magnified past 1:1
+        if self.source_size is None or not self.initizlied:
+            return False
+        scale = self.source_size[0] / frame_width
+        return scale > 1 and self.transform().m11() * self.devicePixelRatioF() * scale > 1
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.timer_resize.start(RESIZE_DEBOUNCE_MS)
     
     def clear_scene(self):
-        self._scene.clear()
+        self.pixmap_item.setPixmap(QPixmap())
+        self.pixmap_item.setScale(1)
+        self.initizlied = False
         
     def update_scene(self, frame):
+        # frame is a BGR view into the reader's buffer. The QImage wraps that
+        # memory without copying, so keep the array referenced alongside it.
+        if frame is None:
+            return
         h, w, ch = frame.shape
-        bytes_per_line = ch * w
-        qimg = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimg)
-        pixmap_item = QGraphicsPixmapItem(pixmap)
-        self._scene.addItem(pixmap_item)
+        if HAS_BGR888:
+            image_format = QImage.Format_BGR888
+        else:
+            if self._rgb_buf is None or self._rgb_buf.shape != frame.shape:
+                self._rgb_buf = np.empty_like(frame)
+            import cv2
+            with tracer.span("scene.convert"):
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
+            image_format = QImage.Format_RGB888
+        
+        self._frame_ref = frame
+        qimg = QImage(frame.data, w, h, frame.strides[0], image_format)
+        
+        size_changed = self.pixmap_item.pixmap().size() != qimg.size()
+        with tracer.span("scene.upload"):
+            self.pixmap_item.setPixmap(QPixmap.fromImage(qimg))
+        if size_changed:
+            if self.source_size is not None:
+                self.pixmap_item.setScale(self.source_size[0] / w)
+            self._scene.setSceneRect(self.pixmap_item.sceneBoundingRect())
         
         # resize view to fit image
         if not self.initizlied:
             self.reset_view()
             self.initizlied = True        
+        if self.pending_view is not None:
+            self._apply_view(self.pending_view)
+            self.pending_view = None
+    
+    def view_state(self):
+        center = self.mapToScene(self.viewport().rect().center())
+        return {"scale": self.transform().m11(), "center": [center.x(), center.y()]}
+    
+    def set_view_state(self, state):
+        if self.initizlied and not self.pixmap_item.pixmap().isNull():
+            self._apply_view(state)
+        else:
+            self.pending_view = state
+    
+    def _apply_view(self, state):
+        self.resetTransform()
+        self.scale(state["scale"], state["scale"])
+        self.centerOn(*state["center"])
+        self.zoom_changed.emit()
     
     def reset_view(self):
         self.resetTransform()
-        items = self._scene.items()
-        if items:
-            self.fitInView(items[0], Qt.KeepAspectRatio)
+        if not self.pixmap_item.pixmap().isNull():
+            self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+    
+    def memory_footprint(self):
+        # (number of scene items, bytes held by the displayed pixmap)
+        pixmap = self.pixmap_item.pixmap()
+        return len(self._scene.items()), pixmap.width() * pixmap.height() * pixmap.depth() // 8
     
     def enable_pan_mode(self):
         self.setDragMode(QGraphicsView.ScrollHandDrag)
@@ -66,23 +156,42 @@ class ScencePanel(QGraphicsView):
             self.scale(zoom_in_factor, zoom_in_factor)
         else:
             self.scale(zoom_out_factor, zoom_out_factor)
+        self.zoom_changed.emit()
     
         
 class VideoPanel(QWidget):
     
     file_selected = pyqtSignal(dict)
+    video_closed = pyqtSignal()
+    frame_decoded = pyqtSignal(int, object) # frame number, BGR frame or None, when synchronized
+    offset_changed = pyqtSignal(float) # start of the stream on the master clock [s]
     
-    def __init__(self):
+    def __init__(self, decode_workers=0, build_thumbnails=False, disk_cache=None, decoder="auto"):
         super().__init__()
         self.init_ui()
+        self.decode_workers = decode_workers # decoder processes for fast-playback prefetch
+        self.decoder = decoder # decoder backend, "auto" to probe each file
+        self.build_thumbnails = build_thumbnails # scrub previews for the controller's slider
+        self.disk_cache = disk_cache # DiskFrameCache shared by the panels, or None
         self.video_reader = None # VideoReader()
+        self.thumbnails = None
+        self.frame_worker = None
+        self.target_frame = 0 # last requested frame
+        self.shown_frame = None # frame on screen
+        self.synchronized = False # frames are shown by a PlaybackCoordinator
         self.playing = False
         
+        self.timer_memory = QTimer(self)
+        self.timer_memory.timeout.connect(self.update_memory_label)
+        self.timer_memory.start(MEMORY_REFRESH_MS)
+        
     def init_ui(self):
         # entire layout
         layout = QVBoxLayout()
         
         self.scene_panel = ScencePanel()
+        self.scene_panel.viewport_resized.connect(self.update_display_size)
+        self.scene_panel.zoom_changed.connect(self.check_full_resolution)
         layout_ui = self.init_ui_control_panel()
 
         layout.addLayout(layout_ui)
@@ -104,6 +213,15 @@ class VideoPanel(QWidget):
         self.text_load = QLabel("Video file name")
         self.button_zoom = QToolButton()
         self.button_reset = QToolButton()
+        self.text_memory = QLabel()
+        self.dspin_offset = QDoubleSpinBox()
+        
+        self.dspin_offset.setRange(-MAX_OFFSET, MAX_OFFSET)
+        self.dspin_offset.setDecimals(3)
+        self.dspin_offset.setSingleStep(0.01)
+        self.dspin_offset.setPrefix("offset ")
+        self.dspin_offset.setSuffix(" s")
+        self.dspin_offset.valueChanged.connect(self.offset_changed.emit)
         
         self.button_load.setText("📁")
         self.button_zoom.setText("🔍")
@@ -117,6 +235,8 @@ class VideoPanel(QWidget):
         
         layout.addWidget(self.button_load)
         layout.addWidget(self.text_load)
+        layout.addWidget(self.text_memory)
+        layout.addWidget(self.dspin_offset)
         layout.addWidget(self.button_zoom)
         layout.addWidget(self.button_reset)
 
@@ -130,6 +250,12 @@ class VideoPanel(QWidget):
                                                   )
         if not filename: 
             return
+        self.open_video(filename)
+    
+    def open_video(self, filename):
+        # the decoder modules are imported with the first video
+        from ..processing import ThreadVideoReader
+        from ..processing.thumbnail_index import ThumbnailIndex
         
         # set file name
         self.videofile = filename
@@ -138,15 +264,78 @@ class VideoPanel(QWidget):
         self.text_load.setText(elided_text)
         
         # read video file
+        self.close_video()
         # self.video_reader = VideoReader(filename)
-        self.video_reader = ThreadVideoReader(filename)
-        self.update_next()
+        self.video_reader = ThreadVideoReader(filename, decode_workers=self.decode_workers,
+                                              disk_cache=self.disk_cache, decoder=self.decoder)
+        self.video_reader.set_display_size(*self.scene_panel.viewport_pixels())
+        self.scene_panel.set_source_size(*self.video_reader.frame_size)
+        self.frame_worker = FrameWorker(self.video_reader)
+        self.frame_worker.frame_ready.connect(self.receive_frame)
+        self.frame_worker.start()
+        if self.build_thumbnails:
+            self.thumbnails = ThumbnailIndex(filename, self.video_reader.total_frames,
+                                             self.video_reader.frame_size)
+            self.thumbnails.start(self.video_reader.keyframes, self.video_reader.decoder.name,
+                                  self.video_reader.timestamps)
+        
+        self.update_specific_frame(0)
         self.file_selected.emit({
             "filename": filename,
             "total_frames": self.video_reader.total_frames,
             "fps": self.video_reader.fps,
+            "timestamps": self.video_reader.timestamps,
+            "thumbnails": self.thumbnails,
         })
 
+    def session_state(self):
+        if self.video_reader is None:
+            return None
+        return {"path": self.videofile, "offset": self.offset(),
+                "view": self.scene_panel.view_state()}
+    
+    def restore_session(self, state):
+        self.dspin_offset.setValue(state.get("offset", 0))
+        self.open_video(state["path"])
+        if state.get("view"):
+            self.scene_panel.set_view_state(state["view"])
+    
+    def close_video(self):
+        if self.frame_worker is not None:
+            self.frame_worker.stop()
+            self.frame_worker = None
+        if self.thumbnails is not None:
+            self.thumbnails.close()
+            self.thumbnails = None
+        if self.video_reader is not None:
+            self.video_reader.close()
+            self.video_reader = None
+            self.video_closed.emit()
+        self.shown_frame = None
+        self.scene_panel.clear_scene()
+    
+    def offset(self):
+        return self.dspin_offset.value()
+
+    def update_display_size(self, width, height):
+        if self.video_reader is None:
+            return
+        self.video_reader.set_display_size(width, height)
+        self.frame_worker.request(self.target_frame) # redraw at the new resolution
+    
+    def check_full_resolution(self):
+        if self.video_reader is None:
+            return
+        frame = self.scene_panel.pixmap_item.pixmap()
+        if not frame.isNull() and self.scene_panel.is_undersampled(frame.width()):
+            self.frame_worker.request_full(self.target_frame)
+
+    def update_memory_label(self):
+        num_items, pixmap_bytes = self.scene_panel.memory_footprint()
+        cache_bytes = 0 if self.video_reader is None else self.video_reader.buffer.nbytes
+        self.text_memory.setText("items: %d | frame: %.1f MB | cache: %.1f MB"%(
+            num_items, pixmap_bytes / 1e6, cache_bytes / 1e6))
+
     def update_frame(self, frame=None, dframe=None):
         if frame == NULL_SIGNAL and dframe == NULL_SIGNAL:
             return
@@ -167,27 +356,53 @@ class VideoPanel(QWidget):
             if self.playing:
                 self.timer.stop()
                 self.playing = False
-            frame = func(self, *args, **kwargs)
-            self.scene_panel.update_scene(frame)
+            nframe = func(self, *args, **kwargs)
+            if 0 <= nframe < self.video_reader.total_frames:
+                self.target_frame = nframe
+                self.frame_worker.request(nframe) # answered by receive_frame
         return wrapper
     
     @video_move_wrapper
     def update_next(self):
-        return self.video_reader.move_next() # RGB image
+        return self.target_frame + 1
     
     @video_move_wrapper
     def update_prev(self):
-        return self.video_reader.move_prev() # RGB image
+        return self.target_frame - 1
         
     @video_move_wrapper
     def update_specific_frame(self, nframe):
-        return self.video_reader.move_specific_frame(nframe)
+        return nframe
+    
+    def receive_frame(self, nframe, frame):
+        if nframe != self.target_frame:
+            return # superseded by a newer request
+        if frame is None: # could not be decoded, the previous frame stays on screen
+            if self.synchronized:
+                self.frame_decoded.emit(nframe, None)
+            return
+        if self.scene_panel.is_undersampled(frame.shape[1]):
+            # zoomed in past the cached resolution, show the full frame instead
+            self.frame_worker.request_full(nframe)
+            return
+        if self.synchronized:
+            self.frame_decoded.emit(nframe, frame)
+        else:
+            self.present_frame(nframe, frame)
+    
+    def present_frame(self, nframe, frame):
+        # nframe None: the stream has no frame at this instant
+        self.shown_frame = nframe
+        if frame is None:
+            self.scene_panel.pixmap_item.setPixmap(QPixmap()) # keep the view as it is
+        else:
+            self.scene_panel.update_scene(frame) # BGR image
     
     def connect_controller(self, controller: VideoController):
         controller.signal_move_frame.connect(self.update_frame)
     
     def keyPressEvent(self, event):
-        print(f"Key pressed in videopanel: {event.key()}")
+        logger.debug("Key pressed in videopanel: %d", event.key())
         event.ignore()
         
     
\ No newline at end of file
@@ -1,6 +1,13 @@
-from .video_reader import VideoReader, ThreadVideoReader
+from importlib import import_module
 
 
 __all__ = [
     "VideoReader",
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    # the readers pull in cv2, which is only needed once a video is opened
+    if name in ("VideoReader", "ThreadVideoReader"):
+        return getattr(import_module(".video_reader", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
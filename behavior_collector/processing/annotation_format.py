@@ -0,0 +1,172 @@
+"""
+Binary annotation container (.bhv).
+
+Layout (little endian):
+    magic b"BHV1" | header length (uint32) | JSON header | padding to 64 bytes
+    | per behavior: int32 starts[count], int32 ends[count]
+
+The header holds video_path, max_frames, behav_info, the (offset, count) of
+every behavior's columns, with offsets relative to the end of the padding,
+and an optional "meta" dict for the writer's own bookkeeping.
+Event bouts stored as [start] get end = -1, so the conversion to and from the
+JSON format is lossless.
+"""
+import os
+import json
+import tempfile
+import numpy as np
+
+from .interval_index import IntervalIndex
+
+
+BINARY_EXT = ".bhv"
+MAGIC = b"BHV1"
+ALIGNMENT = 64
+
+
+class FrameColumns:
+    # bouts of one behavior as start/end columns, possibly memory-mapped
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+
+    @staticmethod
+    def from_frames(frames):
+        starts = np.fromiter((frame_range[0] for frame_range in frames),
+                             dtype=np.int32, count=len(frames))
+        ends = np.fromiter((frame_range[1] if len(frame_range) > 1 else -1 for frame_range in frames),
+                           dtype=np.int32, count=len(frames))
+        return FrameColumns(starts, ends)
+
+    def load(self):
+        # frame ranges in the BehavInfo format: [start] or [start, end]
+        return [[s] if e < 0 else [s, e] for s, e in zip(self.starts.tolist(), self.ends.tolist())]
+
+    def to_index(self):
+        return IntervalIndex.from_arrays(self.starts, np.where(self.ends < 0, self.starts, self.ends))
+
+
+class LazyDict(dict):
+    """dict whose FrameColumns values are converted to frame lists on first access"""
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, FrameColumns):
+            value = value.load()
+            super().__setitem__(key, value)
+        return value
+
+    def raw(self, key):
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+
+def _frame_columns(behav_frames, behav_name):
+    if isinstance(behav_frames, LazyDict):
+        raw = behav_frames.raw(behav_name)
+        if isinstance(raw, FrameColumns):
+            return raw # not materialized yet, write the columns as they are
+    return FrameColumns.from_frames(behav_frames[behav_name])
+
+
+def _data_offset(header_len):
+    return -(-(len(MAGIC) + 4 + header_len) // ALIGNMENT) * ALIGNMENT
+
+
+def write_binary(file_path, video_path, max_frames, behav_info, behav_frames, meta=None, sync=False):
+    columns = {name: _frame_columns(behav_frames, name) for name in behav_frames.keys()}
+
+    layout = {}
+    offset = 0
+    for name, column in columns.items():
+        layout[name] = [offset, len(column.starts)]
+        offset += 8 * len(column.starts)
+
+    header = {
+        "video_path": video_path,
+        "max_frames": max_frames,
+        "behav_info": behav_info,
+        "columns": layout,
+        "meta": meta or {},
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_offset = _data_offset(len(header_bytes))
+
+    # write next to the target and rename: the columns may be memory-mapped
+    # from the file being replaced. The temporary name is unique, so writers
+    # of the same file (e.g. two journals of one session) never share it
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)),
+                                    prefix=os.path.basename(file_path) + ".", suffix=".tmp")
+    try:
+        # mkstemp creates the file private, keep the mode of the file being replaced
+        os.chmod(tmp_path, os.stat(file_path).st_mode & 0o777 if os.path.exists(file_path) else 0o644)
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(MAGIC)
+            fp.write(len(header_bytes).to_bytes(4, "little"))
+            fp.write(header_bytes)
+            fp.write(b"\0" * (data_offset - fp.tell()))
+            for column in columns.values():
+                fp.write(np.ascontiguousarray(column.starts, dtype="<i4").tobytes())
+                fp.write(np.ascontiguousarray(column.ends, dtype="<i4").tobytes())
+            if sync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_header(file_path):
+    # (header dict, offset of the column data)
+    with open(file_path, "rb") as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a behavior annotation file: {file_path}")
+        header_len = int.from_bytes(fp.read(4), "little")
+        header = json.loads(fp.read(header_len).decode("utf-8"))
+    return header, _data_offset(header_len)
+
+
+def read_binary(file_path, mmap=True):
+    """
+    Read a .bhv file into BehavInfo keyword arguments. With mmap the columns
+    are memory-mapped, and a behavior's frame list is only built when accessed.
+    """
+    header, data_offset = read_header(file_path)
+
+    behav_frames = LazyDict()
+    for name, (offset, count) in header["columns"].items():
+        offset += data_offset
+        if count == 0:
+            data = np.empty((2, 0), dtype="<i4")
+        elif mmap:
+            data = np.memmap(file_path, dtype="<i4", mode="r", offset=offset, shape=(2, count))
+        else:
+            data = np.fromfile(file_path, dtype="<i4", count=2*count, offset=offset).reshape(2, count)
+        behav_frames[name] = FrameColumns(data[0], data[1])
+
+    return {
+        "video_path": header["video_path"],
+        "max_frames": header["max_frames"],
+        "behav_info": header["behav_info"],
+        "behav_frames": behav_frames,
+    }
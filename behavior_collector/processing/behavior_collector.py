@@ -1,12 +1,19 @@
 # export with json format
 import os
 import json
+import numpy as np
 from typing import List, Dict
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from collections import OrderedDict
 
+from .interval_index import IntervalIndex
+from .tracing import get_logger
+from .annotation_format import BINARY_EXT, FrameColumns, LazyDict, read_binary, write_binary
+
 BEHAV_TYPE = ("State", "Event")
 
+logger = get_logger("annotations")
+
 
 @dataclass
 class BehavInfo:
@@ -15,6 +22,42 @@ class BehavInfo:
     behav_info: Dict = None
     behav_frames: Dict = None
     
+    def __post_init__(self):
+        if self.behav_info is None:
+            self.behav_info = {}
+        self.journal = None # AnnotationJournal recording every change, if any
+    
+    def _log(self, op: str, **fields):
+        if self.journal is not None:
+            self.journal.append(op, **fields)
+    
+    def _set_frames(self, behav_frames):
+        # the interval indexes hold the bouts, built from the loaded frames
+        # of a behavior on its first access
+        self._loaded = behav_frames if behav_frames is not None else {}
+        self.intervals = {name: None for name in self._loaded.keys()}
+    
+    def _loaded_frames(self, behav_name: str):
+        frames = self._loaded
+        if behav_name not in frames:
+            return []
+        return frames.raw(behav_name) if isinstance(frames, LazyDict) else frames[behav_name]
+    
+    def _index(self, behav_name: str):
+        index = self.intervals.get(behav_name)
+        if index is None:
+            raw = self._loaded_frames(behav_name)
+            if isinstance(raw, FrameColumns):
+                index = raw.to_index()
+            else:
+                index = IntervalIndex.from_frames(raw)
+            self.intervals[behav_name] = index
+            self._loaded.pop(behav_name, None) # the index is the only copy from now on
+        return index
+    
+    def _is_event(self, behav_name: str):
+        return self.behav_info[behav_name]["behavior_type"] == "Event"
+    
     def add_behavior(self, behav_name: str,
                      behav_type: str, behav_note: str, behav_color: str):
         
@@ -26,36 +69,164 @@ class BehavInfo:
             "behavior_note": behav_note,
             "behavior_color": behav_color
         }
-        self.behav_frames[behav_name] = []
+        self.intervals[behav_name] = IntervalIndex()
+        self._log("add_behavior", name=behav_name, type=behav_type,
+                  note=behav_note, color=behav_color)
     
     def add_frame(self, behav_name: str, start_frame: int, end_frame: int=None):
-        print("Behavior added:", behav_name, start_frame, end_frame)
+        logger.debug("Behavior added: %s %d %s", behav_name, start_frame, end_frame)
+        self._check_behav(behav_name)
+        if end_frame is not None:
+            start_frame, end_frame = min(start_frame, end_frame), max(start_frame, end_frame)
+        self._index(behav_name).insert(start_frame, start_frame if end_frame is None else end_frame)
+        self._log("add_frame", name=behav_name, start=start_frame, end=end_frame)
+    
+    def remove_frame(self, behav_name: str, start_frame: int=-1, bout_id: int=-1,
+                     frame_id: int=-1):
+        """
+        Remove a bout, given either a frame inside it (start_frame) or its
+        position in time order (bout_id, formerly frame_id). Returns the
+        removed frame range.
+        """
+        self._check_behav(behav_name)
+        if bout_id == -1:
+            bout_id = frame_id
+        if start_frame == -1 and bout_id == -1:
+            raise ValueError("Either start_frame or bout_id must be provided")
+        
+        index = self._index(behav_name)
+        if bout_id == -1:
+            bout_id = index.find(start_frame)
+            if bout_id == -1:
+                raise ValueError(f"No {behav_name} bout at frame {start_frame}")
+        elif not (0 <= bout_id < len(index)):
+            raise ValueError(f"No {behav_name} bout {bout_id}")
+        start, end = index.remove(bout_id)
+        self._log("remove_frame", name=behav_name, bout_id=bout_id, start=start, end=end)
+        return [start] if start == end and self._is_event(behav_name) else [start, end]
+    
+    def active_behaviors(self, nframe: int):
+        return [name for name in self.intervals.keys() if self._index(name).contains(nframe)]
+    
+    def query_frames(self, behav_name: str, start_frame: int, end_frame: int):
+        # (starts, ends) of the bouts overlapping [start_frame, end_frame]
         self._check_behav(behav_name)
-        if end_frame is None:
-            frame_range = [start_frame]
-        else:
-            frame_range = [start_frame, end_frame]
-        self.behav_frames[behav_name].append(frame_range)
+        return self._index(behav_name).query(start_frame, end_frame)
     
-    def remove_frame(self, behav_name: str, start_frame: int=-1, frame_id: int=-1):
+    def merge_frames(self, behav_name: str, gap: int=0):
+        # merge bouts that overlap, touch or have at most gap frames between them
         self._check_behav(behav_name)
-        if start_frame == -1 and frame_id == -1:
-            raise ValueError("Either start_frame or frame_id must be provided")
+        self._index(behav_name).merge_adjacent(gap)
+        self._log("merge_frames", name=behav_name, gap=gap)
+    
+    def frame_arrays(self, behav_name: str):
+        # (starts, ends) of all the bouts in time order
+        self._check_behav(behav_name)
+        return self._index(behav_name).to_arrays()
+    
+    def _frame_columns(self, behav_name: str):
+        if self.intervals.get(behav_name) is None: # unchanged since loading
+            raw = self._loaded_frames(behav_name)
+            return raw if isinstance(raw, FrameColumns) else FrameColumns.from_frames(raw)
+        starts, ends = self.intervals[behav_name].to_arrays()
+        if self._is_event(behav_name): # single-frame events are saved as [start]
+            ends = np.where(starts == ends, -1, ends)
+        return FrameColumns(starts.astype(np.int32), ends.astype(np.int32))
+    
+    def serialized_frames(self):
+        # {behavior: FrameColumns} to save, a copy of the current bouts
+        frames = LazyDict()
+        for behav_name in self.behav_info.keys():
+            frames[behav_name] = self._frame_columns(behav_name)
+        return frames
+    
+    def bouts(self, behav_name: str):
+        # bouts in the file format: [start] or [start, end]
+        self._check_behav(behav_name)
+        return self._frame_columns(behav_name).load()
+    
+    def num_rows(self, fps: float=None, target_fps: float=None):
+        # rows of the rasterized labels, max_frames resampled to target_fps
+        if target_fps is None:
+            return self.max_frames
+        if fps is None:
+            raise ValueError("fps is required to resample to target_fps")
+        return int(np.ceil(self.max_frames * (target_fps / fps)))
+    
+    def rasterize(self, behav_names: List[str]=None, out=None, dtype=np.uint8,
+                  fps: float=None, target_fps: float=None, row_range: tuple=None,
+                  chunk_frames: int=1 << 18):
+        """
+        Per-frame labels as a (frames, behaviors) array, State bouts and Event
+        frames set to 1. out can be an array of that shape (e.g. a memmap) or a
+        .npy path, which is created as a memmap. With fps and target_fps the
+        labels are resampled to target_fps, a row being set if any frame in it
+        is labeled. row_range=(start, stop) limits the output to those rows.
+        Filled in chunks of rows, so the temporary memory does not depend on
+        max_frames.
+        """
+        if behav_names is None:
+            behav_names = list(self.behav_info.keys())
+        last_row = self.num_rows(fps, target_fps)
+        ratio = 1.0 if target_fps is None else target_fps / fps
+        first_row = 0
+        if row_range is not None:
+            first_row, last_row = row_range[0], min(row_range[1], last_row)
+        num_rows = max(last_row - first_row, 0)
+        shape = (num_rows, len(behav_names))
+        
+        if out is None:
+            out = np.zeros(shape, dtype=dtype)
+        elif isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+        elif out.shape != shape:
+            raise ValueError(f"Output shape {out.shape} does not match {shape}")
+        
+        for behav_name in behav_names:
+            self._check_behav(behav_name)
+        indices = [self._index(behav_name) for behav_name in behav_names]
+        
+        # whole rows at a time, out may be a row-major file
+        block = np.empty((min(chunk_frames, max(num_rows, 1)), len(behav_names)), dtype=dtype)
+        mask = np.empty(len(block), dtype=bool)
+        work = np.empty(len(block) + 1, dtype=np.int32)
+        for row_start in range(0, num_rows, len(block)):
+            n = min(len(block), num_rows - row_start)
+            for col, index in enumerate(indices):
+                block[:n, col] = index.coverage(first_row + row_start, n, ratio, mask[:n], work)
+            out[row_start:row_start+n] = block[:n]
+        return out
     
     @staticmethod
-    def load(file_path: str):
+    def load(file_path: str, mmap: bool=True):
+        # JSON, or the binary format for files ending with BINARY_EXT
+        if file_path.endswith(BINARY_EXT):
+            return BehavInfo(**read_binary(file_path, mmap=mmap))
         with open(file_path, "r") as fp:
             json_data = json.load(fp)
         return BehavInfo(**json_data) 
     
     def save(self, file_path: str):
+        frames = self.serialized_frames()
+        if file_path.endswith(BINARY_EXT):
+            write_binary(file_path, self.video_path, self.max_frames, self.behav_info, frames)
+            return
         with open(file_path, "w") as fp:
-            json.dump(asdict(self), fp, indent=4)
+            json.dump({
+                "video_path": self.video_path,
+                "max_frames": self.max_frames,
+                "behav_info": self.behav_info,
+                "behav_frames": dict(frames.items()), # frame lists
+            }, fp, indent=4)
     
     def _check_behav(self, behav_name: str):
         if behav_name not in self.behav_info.keys():
             raise ValueError("Behavior does not exist")
-        
+
+
+# behav_frames reads through to the interval indexes: {behavior: bouts in the
+# file format}, rebuilt on every access. Assigning it replaces all the bouts
+BehavInfo.behav_frames = property(BehavInfo.serialized_frames, BehavInfo._set_frames)
 
 
 # class BehaviorCollector:
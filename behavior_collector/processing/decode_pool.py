@@ -0,0 +1,157 @@
+"""
+Decode frames of one video in worker processes.
+
+The requested frames are grouped by GOP (the keyframe they are decoded from),
+and each group is decoded by a worker process that seeks to the keyframe and
+decodes forward, so the workers never depend on each other. Decoded frames
+are written into slots of a shared memory block and only the frame numbers
+travel back through the pipe.
+"""
+import os
+import cv2
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .decoders import open_decoder
+
+
+CHUNK_FRAMES = 32 # frames decoded by one task at most
+POOL_MEMORY = 256 * 1024**2 # bytes of shared frame slots
+
+_worker_decoder = None
+_worker_shm = {}
+
+
+def _init_worker(file_path, backend, timestamps):
+    global _worker_decoder
+    cv2.setNumThreads(1) # one process per core already
+    _worker_decoder = open_decoder(file_path, backend, threads=1, timestamps=timestamps)
+
+
+def _attach(shm_name):
+    shm = _worker_shm.get(shm_name)
+    if shm is None:
+        for old in _worker_shm.values():
+            old.close()
+        _worker_shm.clear()
+        shm = _worker_shm[shm_name] = shared_memory.SharedMemory(name=shm_name)
+    return shm
+
+
+def _decode_chunk(shm_name, slots_shape, key_frame, frames, slots):
+    # decode frames (sorted, all after key_frame) into their slots, return
+    # the frame numbers that were decoded
+    slot_frames = np.ndarray(slots_shape, dtype=np.uint8, buffer=_attach(shm_name).buf)
+    height, width = slots_shape[1:3]
+
+    _worker_decoder.seek(key_frame)
+    decoded = []
+    for nframe, slot in zip(frames, slots):
+        while 0 <= _worker_decoder.pos < nframe and _worker_decoder.grab():
+            pass
+        frame = _worker_decoder.read((width, height))
+        if frame is None:
+            break
+        np.copyto(slot_frames[slot], frame)
+        decoded.append(nframe)
+    return decoded
+
+
+class DecodePool:
+    """
+    Pool of decoder processes for one video.
+
+    `decode(frames, size, keyframes)` yields (frame number, frame) as the
+    chunks finish, not in order. The frame is a view into shared memory that
+    is recycled once the generator resumes, so copy it (e.g. into a
+    FrameRingBuffer) before asking for the next one. Frames are resized to
+    size (width, height) in the workers. Without a KeyframeIndex every frame
+    is decoded by its own seek.
+    """
+    def __init__(self, file_path, num_workers=None, memory=POOL_MEMORY, backend="opencv",
+                 timestamps=None):
+        # timestamps: TimestampIndex of the video, handed to the worker decoders
+        self.file_path = file_path
+        self.num_workers = num_workers or max(os.cpu_count() - 1, 1)
+        self.memory = memory
+
+        self.shm = None
+        self.slots = None # (num_slots, h, w, 3) view of the shared memory
+        # spawn: forking a process that runs decoder threads is unsafe
+        self.executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                            mp_context=mp.get_context("spawn"),
+                                            initializer=_init_worker,
+                                            initargs=(file_path, backend, timestamps))
+
+    def _allocate(self, size):
+        width, height = size
+        shape = (height, width, 3)
+        if self.slots is not None and self.slots.shape[1:] == shape:
+            return
+        self._release()
+        num_slots = max(self.memory // int(np.prod(shape)), self.num_workers)
+        self.shm = shared_memory.SharedMemory(create=True, size=num_slots * int(np.prod(shape)))
+        self.slots = np.ndarray((num_slots,) + shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def _release(self):
+        if self.shm is not None:
+            self.slots = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    @staticmethod
+    def _chunks(frames, chunk_frames, keyframes=None):
+        # (keyframe, frames) groups, at most chunk_frames per group
+        frames = np.unique(np.asarray(frames, dtype=np.int64))
+        if keyframes is None:
+            keys = frames
+        else:
+            idx = np.searchsorted(keyframes.keyframes, frames, side="right") - 1
+            keys = keyframes.keyframes[np.maximum(idx, 0)]
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        for key_frames, key in zip(np.split(frames, bounds), keys[np.r_[0, bounds]]):
+            for i in range(0, len(key_frames), chunk_frames):
+                yield int(key), key_frames[i:i+chunk_frames].tolist()
+
+    def decode(self, frames, size, keyframes=None):
+        if len(frames) == 0:
+            return
+        self._allocate(size)
+        num_slots = len(self.slots)
+        chunk_frames = max(min(CHUNK_FRAMES, num_slots // (2 * self.num_workers)), 1)
+        chunks = self._chunks(frames, chunk_frames, keyframes)
+        free_slots = list(range(num_slots))
+        running = {}
+
+        def _submit():
+            while len(free_slots) >= chunk_frames:
+                key, chunk = next(chunks, (None, None))
+                if chunk is None:
+                    return
+                slots = [free_slots.pop() for _ in chunk]
+                future = self.executor.submit(_decode_chunk, self.shm.name, self.slots.shape,
+                                              key, chunk, slots)
+                running[future] = (chunk, slots)
+
+        try:
+            _submit()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk, slots = running.pop(future)
+                    slot_of = dict(zip(chunk, slots))
+                    for nframe in future.result():
+                        yield nframe, self.slots[slot_of[nframe]]
+                    free_slots.extend(slots)
+                _submit()
+        finally:
+            # the caller stopped early: let the running chunks finish before
+            # their slots can be reused
+            wait(running)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self._release()
@@ -0,0 +1,321 @@
+"""
+Decoder backends behind the video readers.
+
+A decoder reads one video stream forward and can be repositioned:
+
+    seek(nframe, keyframes)  the next read() returns nframe
+    grab()                   decode and drop one frame, False at the end
+    read(size)               next frame as BGR (h, w, 3), scaled to size
+                             (width, height) if given, None at the end
+    pos                      frame number the next read() returns, -1 if unknown
+
+The returned frame is the decoder's scratch buffer, valid until the next
+read. OpenCVDecoder wraps cv2.VideoCapture. PyAVDecoder (optional,
+`pip install av`) decodes with the codec's frame and slice threads, seeks by
+PTS and lets libswscale convert and scale to BGR in one pass. With
+backend="auto" the fastest of the available backends is picked per file by
+decoding a few frames.
+
+When the video has a TimestampIndex, PyAVDecoder numbers and seeks frames by
+their exact PTS. OpenCV converts seek targets through the average frame
+rate, which lands on the wrong frame of a variable frame rate video, so
+OpenCVDecoder identifies the frame it landed on by its PTS and decodes
+forward from there. "auto" builds the index before picking a backend and
+prefers PyAV for variable frame rate videos.
+"""
+import time
+import importlib.util
+from fractions import Fraction
+import cv2
+
+from .keyframe_index import _video_signature
+from .timestamp_index import TimestampIndex, load_or_build_indexes
+from .tracing import get_logger
+
+
+PIXEL_FORMAT = "bgr24" # what every backend returns
+PROBE_FRAMES = 24 # frames decoded from the start and from the middle of the file
+PROBE_MARGIN = 1.1 # another backend must be this much faster than OpenCV to be picked
+
+logger = get_logger("decoders")
+
+
+def seek_capture(cap, cap_pos, nframe, keyframes=None):
+    # position cap so that the next read returns nframe, return the new position
+    if cap_pos == nframe:
+        return cap_pos
+    if keyframes is None:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, nframe)
+        return nframe
+
+    # jump to the keyframe only if nframe cannot be reached by decoding forward
+    key = keyframes.keyframe_before(nframe)
+    if not (key <= cap_pos < nframe):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, key)
+        cap_pos = key
+    while cap_pos < nframe and cap.grab():
+        cap_pos += 1
+    return cap_pos
+
+
+class OpenCVDecoder:
+    name = "opencv"
+
+    def __init__(self, file_path, threads=0, timestamps=None):
+        # threads is left to OpenCV's FFmpeg backend
+        # timestamps: TimestampIndex of the file, seeks go through the
+        # container's average rate without it
+        self.timestamps = timestamps
+        self.cap = cv2.VideoCapture(file_path)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(f"Could not open video file: {file_path}")
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                           int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.pos = 0
+        self.grabbed = False # frame pos is grabbed already, read() only retrieves it
+        self.decode_buf = None
+        self.resize_buf = None
+
+    def seek(self, nframe, keyframes=None):
+        if self.timestamps is None:
+            self.pos = seek_capture(self.cap, self.pos, nframe, keyframes)
+            return
+        if self.pos == nframe:
+            return
+
+        key = keyframes.keyframe_before(nframe) if keyframes is not None else nframe
+        if not (key <= self.pos < nframe):
+            # jump near the keyframe and read where we landed from the PTS,
+            # further back until it is not past nframe
+            target, step = key, 1
+            while True:
+                if target <= 0:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    self.pos, self.grabbed = 0, False
+                    break
+                self.cap.set(cv2.CAP_PROP_POS_MSEC, self.timestamps.time_of(target) * 1e3)
+                if self._grab_landed() and self.pos <= nframe:
+                    break
+                target -= step
+                step *= 2
+                if keyframes is not None and target > 0:
+                    target = keyframes.keyframe_before(target)
+        # sequential decoding never skips a frame, count from there
+        while 0 <= self.pos < nframe and self.grab():
+            pass
+
+    def _grab_landed(self):
+        if not self.cap.grab():
+            self.pos, self.grabbed = -1, False
+            return False
+        pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1e3
+        self.pos, self.grabbed = max(self.timestamps.frame_at(pts), 0), True
+        return True
+
+    def grab(self):
+        if self.grabbed:
+            self.grabbed = False
+        elif not self.cap.grab():
+            self.pos = -1
+            return False
+        if self.pos >= 0:
+            self.pos += 1
+        return True
+
+    def read(self, size=None):
+        if self.grabbed:
+            self.grabbed = False
+            ret, self.decode_buf = self.cap.retrieve(self.decode_buf)
+        else:
+            ret, self.decode_buf = self.cap.read(self.decode_buf)
+        if not ret:
+            self.pos = -1
+            return None
+        if self.pos >= 0:
+            self.pos += 1
+        if size is None or size == self.frame_size:
+            return self.decode_buf
+        self.resize_buf = cv2.resize(self.decode_buf, size, dst=self.resize_buf,
+                                     interpolation=cv2.INTER_AREA)
+        return self.resize_buf
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVDecoder:
+    name = "pyav"
+
+    def __init__(self, file_path, threads=0, timestamps=None):
+        # threads: decoder threads, 0 lets libavcodec pick one per core
+        # timestamps: TimestampIndex of the file, frame numbers from the
+        # average rate without it
+        try:
+            import av
+        except ImportError:
+            raise ImportError("The pyav decoder needs PyAV (pip install av)") from None
+        try:
+            self.container = av.open(file_path)
+        except (OSError, ValueError) as e:
+            raise FileNotFoundError(f"Could not open video file: {file_path}") from e
+        if not self.container.streams.video:
+            self.container.close()
+            raise FileNotFoundError(f"No video stream in {file_path}")
+
+        self.stream = self.container.streams.video[0]
+        codec = self.stream.codec_context
+        codec.thread_type = "AUTO" # frame and slice threads
+        codec.thread_count = threads
+        self.frame_size = (codec.width, codec.height)
+
+        self.rate = Fraction(self.stream.average_rate or self.stream.guessed_rate or 0)
+        if not self.rate:
+            self.container.close()
+            raise FileNotFoundError(f"Unknown frame rate of {file_path}")
+        self.fps = float(self.rate)
+        self.time_base = Fraction(self.stream.time_base)
+        self.start_pts = self.stream.start_time or 0
+        self.total_frames = self.stream.frames
+        if not self.total_frames and self.stream.duration:
+            self.total_frames = round(self.stream.duration * self.time_base * self.rate)
+
+        self.timestamps = timestamps
+        self.frames = None # decode iterator, restarted after every seek
+        self.pending = None # frame decoded by a seek, returned by the next read
+        self.pos = 0
+
+    def _frame_number(self, frame):
+        if frame.pts is None: # no timestamp, assume it follows the previous frame
+            return max(self.pos, 0)
+        if self.timestamps is not None:
+            return self.timestamps.frame_at(float((frame.pts - self.start_pts) * self.time_base))
+        return round((frame.pts - self.start_pts) * self.time_base * self.rate)
+
+    def _next(self):
+        if self.pending is not None:
+            frame, self.pending = self.pending, None
+            self.pos += 1
+            return frame
+        if self.frames is None:
+            self.frames = self.container.decode(self.stream)
+        try:
+            frame = next(self.frames)
+        except (StopIteration, EOFError, ValueError, OSError): # end of file or corrupt data
+            self.pos = -1
+            return None
+        self.pos = self._frame_number(frame) + 1
+        return frame
+
+    def seek(self, nframe, keyframes=None):
+        if self.pos == nframe:
+            return
+        # decode forward when nframe is in the current GOP, otherwise seek
+        # to the keyframe at or before its PTS
+        forward = (keyframes is not None and
+                   keyframes.keyframe_before(nframe) <= self.pos < nframe)
+        if not forward:
+            # the demuxer may start after a target between keyframes, so aim
+            # at the keyframe itself when it is known
+            start = keyframes.keyframe_before(nframe) if keyframes is not None else nframe
+            if self.timestamps is not None:
+                seconds = Fraction(self.timestamps.time_of(start))
+            else:
+                seconds = start / self.rate
+            target = self.start_pts + round(seconds / self.time_base)
+            self.container.seek(target, stream=self.stream, backward=True, any_frame=False)
+            self.frames = None
+            self.pending = None
+            self.pos = -1
+        while True:
+            frame = self._next()
+            if frame is None:
+                return
+            if self.pos > nframe:
+                self.pending = frame # first frame at or after nframe
+                self.pos -= 1
+                return
+
+    def grab(self):
+        return self._next() is not None
+
+    def read(self, size=None):
+        frame = self._next()
+        if frame is None:
+            return None
+        width, height = size or self.frame_size
+        return frame.to_ndarray(format=PIXEL_FORMAT, width=width, height=height,
+                                interpolation="AREA")
+
+    def release(self):
+        self.container.close()
+
+
+DECODERS = {
+    "opencv": OpenCVDecoder,
+    "pyav": PyAVDecoder,
+}
+_probed = {} # (path, size, mtime) -> backend name
+
+
+def available_backends():
+    backends = ["opencv"]
+    if importlib.util.find_spec("av") is not None:
+        backends.append("pyav")
+    return backends
+
+
+def _probe_time(backend, file_path, num_frames):
+    decoder = DECODERS[backend](file_path)
+    try:
+        t0 = time.perf_counter()
+        for start in (0, decoder.total_frames // 2):
+            decoder.seek(start)
+            for _ in range(num_frames):
+                if decoder.read() is None: # with the conversion to BGR
+                    break
+        return time.perf_counter() - t0
+    finally:
+        decoder.release()
+
+
+def probe_backend(file_path, num_frames=PROBE_FRAMES):
+    """Fastest available backend for file_path, measured once per file and process"""
+    backends = available_backends()
+    if len(backends) == 1:
+        return backends[0]
+    key = (file_path,) + _video_signature(file_path)
+    if key in _probed:
+        return _probed[key]
+
+    timings = {}
+    for backend in backends:
+        try:
+            timings[backend] = _probe_time(backend, file_path, num_frames)
+        except (ImportError, OSError, ValueError):
+            continue # the backend cannot read this file
+    best = min(timings, key=timings.get, default="opencv")
+    if "opencv" in timings and timings[best] * PROBE_MARGIN > timings["opencv"]:
+        best = "opencv"
+    logger.info("Decoder for %s: %s (%s)", file_path, best,
+                ", ".join("%s %.1f ms"%(name, t * 1e3) for name, t in timings.items()))
+    _probed[key] = best
+    return best
+
+
+def open_decoder(file_path, backend="auto", threads=0, timestamps=None):
+    # timestamps: TimestampIndex of the file, its sidecar is loaded if not given
+    if timestamps is None:
+        timestamps = TimestampIndex.load(file_path)
+    if backend == "auto":
+        if timestamps is None: # the frame rate must be known to be constant before probing
+            _, timestamps = load_or_build_indexes(file_path)
+        if (timestamps is not None and not timestamps.constant_rate
+                and "pyav" in available_backends()):
+            backend = "pyav"
+        else:
+            backend = probe_backend(file_path)
+    if backend not in DECODERS:
+        raise ValueError(f"Unknown decoder backend: {backend}")
+    return DECODERS[backend](file_path, threads, timestamps)
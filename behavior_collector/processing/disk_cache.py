@@ -0,0 +1,171 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+CHUNK_FRAMES = 64 # frames per chunk file
+DISK_CACHE_BUDGET = 4 * 1024**3 # bytes of chunk files kept on disk
+MAX_OPEN_CHUNKS = 32 # memory maps kept open
+HASH_BYTES = 1024**2 # bytes read from each end of the video to identify it
+FRAMES_SUFFIX = ".frames.npy"
+VALID_SUFFIX = ".valid.npy"
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "behavior_collector", "frames")
+
+
+def video_hash(video_path):
+    # identifies the video content, so renamed or copied videos share their cache
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(video_path, "rb") as fp:
+        digest.update(fp.read(HASH_BYTES))
+        if size > HASH_BYTES:
+            fp.seek(max(size - HASH_BYTES, HASH_BYTES))
+            digest.update(fp.read(HASH_BYTES))
+    return digest.hexdigest()[:20]
+
+
+class DiskFrameCache:
+    """
+    Decoded frames kept on disk across sessions.
+
+    Frames are stored in memory-mapped chunk files of CHUNK_FRAMES frames,
+    `<root>/<video hash>/<width>x<height>/<first frame>.frames.npy`, next to a
+    `.valid.npy` mask of the frames written so far. Reading a frame back is a
+    copy out of the page cache instead of a decode. Chunks are evicted least
+    recently used first (by file modification time across sessions) once the
+    files exceed `budget` bytes. One instance can be shared by several readers.
+    """
+    def __init__(self, root=None, budget=DISK_CACHE_BUDGET):
+        self.root = root or default_cache_dir()
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.open_chunks = OrderedDict() # frames path -> (frames, valid) memory maps
+        self.usage = OrderedDict() # frames path -> bytes, least recently used first
+        self.nbytes = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        chunks = []
+        for dir_path, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if not file_name.endswith(FRAMES_SUFFIX):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                    nbytes = stat.st_size + os.path.getsize(self._valid_path(path))
+                except OSError:
+                    continue # incomplete chunk, dropped by the eviction
+                chunks.append((stat.st_mtime_ns, path, nbytes))
+        for _, path, nbytes in sorted(chunks):
+            self.usage[path] = nbytes
+            self.nbytes += nbytes
+
+    @staticmethod
+    def _valid_path(frames_path):
+        return frames_path[:-len(FRAMES_SUFFIX)] + VALID_SUFFIX
+
+    def _chunk_path(self, key, size, nframe):
+        start = nframe - nframe % CHUNK_FRAMES
+        return os.path.join(self.root, key, "%dx%d"%(size), "%010d%s"%(start, FRAMES_SUFFIX))
+
+    def _open(self, path, shape=None):
+        # memory maps of a chunk, created with shape (frame shape) if missing
+        chunk = self.open_chunks.get(path)
+        if chunk is not None:
+            self.open_chunks.move_to_end(path)
+            return chunk
+        if path in self.usage:
+            chunk = (np.load(path, mmap_mode="r+"), np.load(self._valid_path(path), mmap_mode="r+"))
+            os.utime(path) # recently used for the next sessions too
+        elif shape is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            valid = open_memmap(self._valid_path(path), mode="w+", dtype=np.uint8,
+                                shape=(CHUNK_FRAMES,))
+            frames = open_memmap(path, mode="w+", dtype=np.uint8,
+                                 shape=(CHUNK_FRAMES,) + shape)
+            chunk = (frames, valid)
+            nbytes = os.path.getsize(path) + os.path.getsize(self._valid_path(path))
+            self.usage[path] = nbytes
+            self.nbytes += nbytes
+        else:
+            return None
+
+        self.open_chunks[path] = chunk
+        if len(self.open_chunks) > MAX_OPEN_CHUNKS:
+            self.open_chunks.popitem(last=False)
+        return chunk
+
+    def _evict(self, keep):
+        while self.nbytes > self.budget and len(self.usage) > 1:
+            path, nbytes = next(iter(self.usage.items()))
+            if path == keep:
+                self.usage.move_to_end(path)
+                continue
+            del self.usage[path]
+            self.open_chunks.pop(path, None)
+            self.nbytes -= nbytes
+            for file_path in (path, self._valid_path(path)):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+    def get(self, key, size, nframe, out=None):
+        """Copy of frame nframe of video key at size (width, height), or None if not cached"""
+        path = self._chunk_path(key, size, nframe)
+        with self.lock:
+            try:
+                chunk = self._open(path)
+            except (OSError, ValueError): # removed or truncated behind our back
+                self._forget(path)
+                return None
+            if chunk is None or not chunk[1][nframe % CHUNK_FRAMES]:
+                return None
+            self.usage.move_to_end(path)
+            frames = chunk[0]
+        frame = frames[nframe % CHUNK_FRAMES]
+        if out is None or out.shape != frame.shape:
+            return np.array(frame)
+        np.copyto(out, frame)
+        return out
+
+    def put(self, key, size, nframe, frame):
+        path = self._chunk_path(key, size, nframe)
+        with self.lock:
+            try:
+                chunk = self._open(path, frame.shape)
+            except (OSError, ValueError): # e.g. disk full
+                self._forget(path)
+                return False
+            frames, valid = chunk
+            if frames.shape[1:] != frame.shape:
+                return False
+            i = nframe % CHUNK_FRAMES
+            if not valid[i]:
+                np.copyto(frames[i], frame)
+                valid[i] = 1
+            self.usage.move_to_end(path)
+            self._evict(keep=path)
+        return True
+
+    def _forget(self, path):
+        self.open_chunks.pop(path, None)
+        nbytes = self.usage.pop(path, None)
+        if nbytes is not None:
+            self.nbytes -= nbytes
+
+    def close(self):
+        with self.lock:
+            for frames, valid in self.open_chunks.values():
+                frames.flush()
+                valid.flush()
+            self.open_chunks.clear()
@@ -0,0 +1,175 @@
+"""
+Headless batch export of annotation files (no Qt).
+
+For every annotation file (.json or .bhv) this writes a per-frame one-hot
+label matrix (frames x behaviors, uint8, see BehavInfo.rasterize) as a .npy
+file or as CSV, optionally resampled to another frame rate, plus a
+small <name>.meta.json with the column order. Per-behavior statistics of all
+the sessions go to summary.csv. Files are processed in parallel worker
+processes, and each matrix is filled in row chunks straight into a
+memory-mapped .npy (or streamed to CSV), so the memory of a worker does not
+grow with the length of the session. With --timestamps the seconds in the
+summary come from the presentation times of the annotated video, which is
+exact for variable frame rate recordings.
+
+    behav_collector export sessions/*.bhv -o labels --format npy --workers 8
+"""
+import os
+import csv
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .behavior_collector import BehavInfo
+
+
+EXPORT_FORMATS = ("npy", "csv")
+CHUNK_FRAMES = 1 << 16 # rows filled at once
+SUMMARY_NAME = "summary.csv"
+SUMMARY_FIELDS = ("session", "behavior", "behavior_type", "count", "total_frames",
+                  "mean_frames", "median_frames", "min_frames", "max_frames",
+                  "latency_frames", "total_s", "latency_s")
+
+
+def summarize(behav_set, session, fps=None, timestamps=None):
+    rows = []
+    for behav_name, info in behav_set.behav_info.items():
+        starts, ends = behav_set.frame_arrays(behav_name)
+        durations = ends - starts + 1
+        row = {
+            "session": session,
+            "behavior": behav_name,
+            "behavior_type": info["behavior_type"],
+            "count": len(starts),
+            "total_frames": int(durations.sum()),
+            "mean_frames": float(durations.mean()) if len(starts) else "",
+            "median_frames": float(np.median(durations)) if len(starts) else "",
+            "min_frames": int(durations.min()) if len(starts) else "",
+            "max_frames": int(durations.max()) if len(starts) else "",
+            "latency_frames": int(starts[0]) if len(starts) else "",
+            "total_s": "",
+            "latency_s": "",
+        }
+        if timestamps is not None: # a bout lasts until the frame after its end
+            row["total_s"] = float(np.sum(timestamps.times_of(ends + 1) - timestamps.times_of(starts)))
+            row["latency_s"] = timestamps.time_of(int(starts[0])) if len(starts) else ""
+        elif fps:
+            row["total_s"] = row["total_frames"] / fps
+            row["latency_s"] = row["latency_frames"] / fps if len(starts) else ""
+        rows.append(row)
+    return rows
+
+
+def _session_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def _video_timestamps(video_path):
+    from .timestamp_index import load_or_build_indexes
+    if not video_path or not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video not found for its timestamps: {video_path}")
+    _, timestamps = load_or_build_indexes(video_path)
+    if timestamps is None:
+        raise ValueError(f"Could not read the timestamps of {video_path}")
+    return timestamps
+
+
+def export_session(file_path, out_dir, fmt="npy", fps=None, target_fps=None, timestamps=False):
+    """
+    Write the label matrix of one annotation file and return its summary rows.
+    timestamps: take the seconds of the summary from the video's frame times.
+    """
+    behav_set = BehavInfo.load(file_path)
+    frame_times = _video_timestamps(behav_set.video_path) if timestamps else None
+    session = _session_name(file_path)
+    behav_names = list(behav_set.behav_info.keys())
+    num_frames = behav_set.num_rows(fps, target_fps) # the rows rasterize() writes
+
+    with open(os.path.join(out_dir, session + ".meta.json"), "w") as fp:
+        json.dump({
+            "source": os.path.abspath(file_path),
+            "video_path": behav_set.video_path,
+            "num_frames": num_frames,
+            "fps": target_fps or fps,
+            "behaviors": behav_names,
+        }, fp, indent=4)
+
+    if fmt == "npy":
+        labels = behav_set.rasterize(behav_names, out=os.path.join(out_dir, session + ".npy"),
+                                     fps=fps, target_fps=target_fps, chunk_frames=CHUNK_FRAMES)
+        labels.flush()
+        del labels
+    elif fmt == "csv":
+        with open(os.path.join(out_dir, session + ".csv"), "w") as fp:
+            fp.write(",".join(["frame"] + behav_names) + "\n")
+            for start in range(0, num_frames, CHUNK_FRAMES):
+                values = behav_set.rasterize(behav_names, fps=fps, target_fps=target_fps,
+                                             row_range=(start, start + CHUNK_FRAMES))
+                frames = np.arange(start, start + len(values))[:, None]
+                np.savetxt(fp, np.hstack((frames, values)), fmt="%d", delimiter=",")
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    return summarize(behav_set, session, fps=fps, timestamps=frame_times)
+
+
+def _export_worker(args):
+    file_path, out_dir, fmt, fps, target_fps, timestamps = args
+    try:
+        return file_path, export_session(file_path, out_dir, fmt, fps, target_fps,
+                                         timestamps), None
+    except Exception as e:
+        return file_path, [], "%s: %s"%(type(e).__name__, e)
+
+
+def export_batch(file_paths, out_dir, fmt="npy", fps=None, target_fps=None, workers=None,
+                 timestamps=False):
+    """
+    Export every file in parallel and write summary.csv. Returns the
+    {file_path: error message} of the files that failed.
+    """
+    if target_fps is not None and fps is None:
+        raise ValueError("--target-fps requires --fps")
+    sessions = [_session_name(file_path) for file_path in file_paths]
+    duplicates = sorted({s for s in sessions if sessions.count(s) > 1})
+    if duplicates:
+        raise ValueError("Annotation files with the same name: %s"%(", ".join(duplicates)))
+    os.makedirs(out_dir, exist_ok=True)
+
+    errors = {}
+    jobs = [(file_path, out_dir, fmt, fps, target_fps, timestamps) for file_path in file_paths]
+    with open(os.path.join(out_dir, SUMMARY_NAME), "w", newline="") as fp:
+        writer = csv.DictWriter(fp, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for file_path, rows, error in pool.map(_export_worker, jobs, chunksize=4):
+                if error is not None:
+                    errors[file_path] = error
+                    print("Failed to export %s (%s)"%(file_path, error))
+                writer.writerows(rows)
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="behav_collector export",
+                                     description="Export annotation files to per-frame label matrices")
+    parser.add_argument("files", nargs="+", help="annotation files (.json or .bhv)")
+    parser.add_argument("-o", "--out-dir", required=True)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="npy")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="frame rate, adds durations and latencies in seconds to the summary")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help="resample the label matrices to this frame rate (requires --fps)")
+    parser.add_argument("--timestamps", action="store_true",
+                        help="seconds in the summary from the frame times of the annotated videos "
+                             "(for variable frame rate recordings)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    errors = export_batch(args.files, args.out_dir, fmt=args.format, fps=args.fps,
+                          target_fps=args.target_fps, workers=args.workers,
+                          timestamps=args.timestamps)
+    print("Exported %d of %d files to %s"%(len(args.files) - len(errors), len(args.files), args.out_dir))
+    return 1 if errors else 0
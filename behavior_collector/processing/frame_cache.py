@@ -0,0 +1,111 @@
+import numpy as np
+
+
+class FrameRingBuffer:
+    """
+    Preallocated frame cache indexed by frame number.
+
+    The buffer keeps `n_behind` frames behind and `n_ahead` frames ahead of the
+    playhead (`center`). A frame is stored in slot `nframe % capacity`, so any
+    frame inside the window owns its slot and frames that drift out of the
+    window are evicted by the first in-window frame that maps onto them.
+    Arrays returned by `get` are views into the buffer and stay valid until the
+    playhead moves. With a `stride` above 1 (fast playback) only the frames
+    ahead on the stride grid are prefetched.
+    """
+    def __init__(self, n_behind, n_ahead):
+        self.center = 0
+        self.stride = 1
+        self.resize(n_behind, n_ahead)
+
+    def resize(self, n_behind, n_ahead):
+        # drops all cached frames
+        self.n_behind = n_behind
+        self.n_ahead = n_ahead
+        self.capacity = n_behind + n_ahead + 1
+        self.frames = None # (capacity, h, w, ch), allocated on the first put
+        self.slot_frame = np.full(self.capacity, -1, dtype=np.int64)
+
+    def clear(self):
+        self.slot_frame[:] = -1
+
+    def set_center(self, nframe):
+        self.center = nframe
+
+    def window(self, total_frames=None):
+        start = max(self.center - self.n_behind, 0)
+        end = self.center + self.n_ahead + 1
+        if total_frames is not None:
+            end = min(end, total_frames)
+        return start, end
+
+    def in_window(self, nframe):
+        return self.center - self.n_behind <= nframe <= self.center + self.n_ahead
+
+    def __contains__(self, nframe):
+        return nframe >= 0 and self.slot_frame[nframe % self.capacity] == nframe
+
+    def __len__(self):
+        start, end = self.window()
+        frames = np.arange(start, end)
+        return int(np.count_nonzero(self.slot_frame[frames % self.capacity] == frames))
+
+    @property
+    def nbytes(self):
+        return 0 if self.frames is None else self.frames.nbytes
+
+    def get(self, nframe):
+        if nframe not in self:
+            return None
+        return self.frames[nframe % self.capacity]
+
+    def put(self, nframe, frame):
+        if not self.in_window(nframe):
+            return False
+        if self.frames is None or self.frames.shape[1:] != frame.shape:
+            self.frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+            self.slot_frame[:] = -1
+
+        slot = nframe % self.capacity
+        self.slot_frame[slot] = -1
+        np.copyto(self.frames[slot], frame)
+        self.slot_frame[slot] = nframe
+        return True
+
+    def missing_ahead(self, total_frames):
+        """Frames from the playhead to the end of the window that still need decoding"""
+        start, end = self.window(total_frames)
+        frames = np.arange(max(start, self.center), end)
+        if self.stride > 1:
+            frames = frames[frames % self.stride == 0]
+        return frames[self.slot_frame[frames % self.capacity] != frames]
+
+    def next_missing(self, total_frames):
+        """Return the next frame the prefetcher should decode, or None if the window is full"""
+        start, end = self.window(total_frames)
+        if start >= end:
+            return None
+
+        frames = np.arange(start, end)
+        if self.stride > 1:
+            frames = frames[(frames >= self.center) & (frames % self.stride == 0)]
+        missing = frames[self.slot_frame[frames % self.capacity] != frames]
+        if missing.size == 0:
+            return None
+
+        ahead = missing[missing >= self.center]
+        behind = missing[missing < self.center]
+
+        # keep enough frames ahead for smooth playback first
+        if ahead.size and ahead[0] - self.center < self.n_ahead // 2:
+            return int(ahead[0])
+
+        # refill behind in batches: decoding forward from the oldest missing
+        # frame amortizes one seek over the whole gap
+        if behind.size and (self.center - behind[-1] <= self.n_behind // 2
+                            or behind.size >= self.n_behind // 4):
+            return int(behind[0])
+
+        if ahead.size:
+            return int(ahead[0])
+        return None
@@ -0,0 +1,197 @@
+import numpy as np
+
+
+class IntervalIndex:
+    """
+    Bouts of one behavior as sorted NumPy start/end arrays.
+
+    Bouts are closed intervals [start, end] (events have start == end) kept
+    sorted by start, so lookups are binary searches. A bout is addressed by
+    its position in time order. `reach` is the running maximum of the ends,
+    so the first bout that can cover a frame is also a binary search.
+    """
+    def __init__(self, capacity=16):
+        self.starts = np.empty(capacity, dtype=np.int64)
+        self.ends = np.empty(capacity, dtype=np.int64)
+        self.reach = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    @staticmethod
+    def from_arrays(starts, ends):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        order = np.argsort(starts, kind="stable")
+
+        index = IntervalIndex(capacity=max(len(starts), 16))
+        index.size = len(starts)
+        index.starts[:index.size] = starts[order]
+        index.ends[:index.size] = ends[order]
+        index._update_reach(0)
+        return index
+
+    @staticmethod
+    def from_frames(frames):
+        # frames in the BehavInfo format: [start] or [start, end]
+        starts = [frame_range[0] for frame_range in frames]
+        ends = [frame_range[-1] for frame_range in frames]
+        return IntervalIndex.from_arrays(starts, ends)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if not (0 <= i < self.size):
+            raise IndexError(f"Bout {i} is out of range")
+        return int(self.starts[i]), int(self.ends[i])
+
+    def to_arrays(self):
+        return self.starts[:self.size], self.ends[:self.size]
+
+    def insert(self, start, end, merge_gap=None):
+        """
+        Insert [start, end] and return its position. With merge_gap, bouts that
+        overlap, touch or lie within merge_gap frames of the new one are merged
+        into it.
+        """
+        if start > end:
+            start, end = end, start
+
+        if merge_gap is not None:
+            i0 = self._first_reaching(start - merge_gap - 1)
+            i1 = np.searchsorted(self.starts[:self.size], end + merge_gap + 1, side="right")
+            if i0 < i1:
+                start = min(start, int(self.starts[i0:i1].min()))
+                end = max(end, int(self.ends[i0:i1].max()))
+                self._delete(i0, i1)
+
+        if self.size == len(self.starts):
+            self.starts = np.resize(self.starts, 2 * self.size)
+            self.ends = np.resize(self.ends, 2 * self.size)
+            self.reach = np.resize(self.reach, 2 * self.size)
+
+        n = self.size
+        i = np.searchsorted(self.starts[:n], start, side="right")
+        self.starts[i+1:n+1] = self.starts[i:n]
+        self.ends[i+1:n+1] = self.ends[i:n]
+        self.starts[i] = start
+        self.ends[i] = end
+        self.size += 1
+        self._update_reach(i)
+        return int(i)
+
+    def remove(self, i):
+        # remove the bout at position i, return its (start, end)
+        bout = self[i]
+        self._delete(i, i + 1)
+        return bout
+
+    def index_of(self, start, end):
+        # position of the bout [start, end], -1 if there is none
+        starts = self.starts[:self.size]
+        i0 = np.searchsorted(starts, start, side="left")
+        i1 = np.searchsorted(starts, start, side="right")
+        match = np.flatnonzero(self.ends[i0:i1] == end)
+        return int(i0 + match[0]) if match.size else -1
+
+    def find(self, nframe):
+        # position of the latest-starting bout covering nframe, -1 if none
+        i0, i1 = self._candidates(nframe, nframe)
+        # back from i1 in doubling windows, a long bout far back does not
+        # make every lookup scan up to it
+        hi, width = i1, 16
+        while hi > i0:
+            lo = max(hi - width, i0)
+            covering = np.flatnonzero(self.ends[lo:hi] >= nframe)
+            if covering.size:
+                return int(lo + covering[-1])
+            hi, width = lo, width * 2
+        return -1
+
+    def contains(self, nframe):
+        i = np.searchsorted(self.starts[:self.size], nframe, side="right")
+        return bool(i > 0 and self.reach[i - 1] >= nframe)
+
+    def query(self, start, end):
+        # (starts, ends) of the bouts overlapping [start, end]
+        i0, i1 = self._candidates(start, end)
+        s, e = self.starts[i0:i1], self.ends[i0:i1]
+        mask = e >= start
+        return s[mask], e[mask]
+
+    def coverage(self, row_start, num_rows, ratio=1.0, out=None, work=None):
+        """
+        Boolean mask of the rows [row_start, row_start + num_rows) covered by a
+        bout, without a loop over the bouts (difference array + cumsum). With a
+        ratio other than 1 rows are resampled frames: row k spans frames
+        [k/ratio, (k+1)/ratio) and is set if any frame in it is covered.
+        out receives the mask and work (int32, num_rows + 1) is scratch space,
+        both can be reused across calls.
+        """
+        if out is None:
+            out = np.empty(num_rows, dtype=bool)
+        if work is None:
+            work = np.empty(num_rows + 1, dtype=np.int32)
+        diff = work[:num_rows + 1]
+        
+        row_end = row_start + num_rows
+        starts, ends = self.query(int(np.floor(row_start / ratio)), int(np.ceil(row_end / ratio)))
+        if ratio == 1:
+            k0, k1 = starts, ends
+        else:
+            k0 = np.floor(starts * ratio).astype(np.int64)
+            k1 = np.ceil((ends + 1) * ratio).astype(np.int64) - 1
+        k0 = np.maximum(k0, row_start) - row_start
+        k1 = np.minimum(k1, row_end - 1) - row_start
+        valid = k0 <= k1
+        
+        diff[:] = 0
+        np.add.at(diff, k0[valid], 1)
+        np.add.at(diff, k1[valid] + 1, -1)
+        np.cumsum(diff[:num_rows], out=diff[:num_rows])
+        np.greater(diff[:num_rows], 0, out=out)
+        return out
+
+    def merge_adjacent(self, gap=0):
+        # merge bouts that overlap, touch or have at most gap frames between them
+        if self.size < 2:
+            return
+        starts, ends = self.to_arrays()
+        reach = np.maximum.accumulate(ends)
+        new_group = np.concatenate(([True], starts[1:] > reach[:-1] + gap + 1))
+        group_starts = starts[new_group]
+        group_ends = np.maximum.reduceat(ends, np.flatnonzero(new_group))
+
+        self.size = len(group_starts)
+        self.starts[:self.size] = group_starts
+        self.ends[:self.size] = group_ends
+        self._update_reach(0)
+
+    def _candidates(self, start, end):
+        # positions [i0, i1) of bouts that may overlap [start, end]
+        # (every bout before i0 ends before start)
+        i0 = np.searchsorted(self.reach[:self.size], start, side="left")
+        i1 = np.searchsorted(self.starts[:self.size], end, side="right")
+        return int(i0), int(max(i0, i1))
+
+    def _first_reaching(self, nframe):
+        # first position whose bout ends at or after nframe
+        i0, i1 = self._candidates(nframe, nframe)
+        reaching = np.flatnonzero(self.ends[i0:i1] >= nframe)
+        return int(i0 + reaching[0]) if reaching.size else i1
+
+    def _delete(self, i0, i1):
+        n = self.size
+        self.starts[i0:n-(i1-i0)] = self.starts[i1:n]
+        self.ends[i0:n-(i1-i0)] = self.ends[i1:n]
+        self.size -= i1 - i0
+        self._update_reach(i0)
+
+    def _update_reach(self, i):
+        # running maximum of the ends from position i on, after a change there
+        n = self.size
+        if i >= n:
+            return
+        reach = self.reach[i:n]
+        np.maximum.accumulate(self.ends[i:n], out=reach)
+        if i > 0:
+            np.maximum(reach, self.reach[i-1], out=reach)
@@ -0,0 +1,251 @@
+"""
+Crash-safe annotation session: a .bhv snapshot plus append-only journal segments.
+
+Every change to a BehavInfo is appended as one JSON line to the current
+journal segment. The write goes straight to the OS, so nothing is lost if the
+program crashes, and a background thread fsyncs the segment as soon as it is
+dirty; records arriving during an fsync are covered by the next one (group
+commit), so a keystroke never waits for the disk.
+
+Compaction writes the whole state to snapshot.bhv in a background thread and
+then deletes the segments it covers. The snapshot records the first journal
+generation it does not include, so a crash at any point leaves either the
+old snapshot with all its segments or the new snapshot.
+
+    <video>.session/snapshot.bhv
+    <video>.session/journal.<generation>
+"""
+import os
+import json
+import time
+import threading
+
+from .behavior_collector import BehavInfo
+from .tracing import get_logger
+from .annotation_format import read_header, write_binary
+
+
+SESSION_SUFFIX = ".session"
+SNAPSHOT_NAME = "snapshot.bhv"
+JOURNAL_PREFIX = "journal."
+COMPACT_EVERY = 2000 # records
+COMPACT_INTERVAL = 300 # s
+
+logger = get_logger("journal")
+
+
+def _fsync_dir(dir_path):
+    # make renames and new files durable, not supported on every platform
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def apply_record(behav_set, record):
+    op = record["op"]
+    if op == "add_behavior":
+        behav_set.add_behavior(record["name"], record["type"], record["note"], record["color"])
+    elif op == "add_frame":
+        behav_set.add_frame(record["name"], record["start"], record.get("end"))
+    elif op == "remove_frame":
+        # "frame_id" in journals written before the rename, same position
+        bout_id = record["bout_id"] if "bout_id" in record else record["frame_id"]
+        behav_set.remove_frame(record["name"], bout_id=bout_id)
+    elif op == "merge_frames":
+        behav_set.merge_frames(record["name"], record["gap"])
+    else:
+        raise ValueError(f"Unknown journal record: {op}")
+
+
+class AnnotationJournal:
+    def __init__(self, session_dir, compact_every=COMPACT_EVERY, compact_interval=COMPACT_INTERVAL):
+        self.session_dir = session_dir
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.behav_set = None
+        self.generation = 0
+        self.num_records = 0 # since the last compaction
+        self.last_compaction = time.monotonic()
+
+        self._fp = None
+        self._dirty = False
+        self._active = True
+        self._cond = threading.Condition()
+        self._compact_thread = None
+        self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+
+    @staticmethod
+    def session_path(video_path):
+        return video_path + SESSION_SUFFIX
+
+    @staticmethod
+    def open(video_path, max_frames, **kwargs):
+        """
+        Restore the annotation session of video_path and start journaling it.
+        Returns (behav_set, journal); journal is None if the session directory
+        cannot be written.
+        """
+        journal = AnnotationJournal(AnnotationJournal.session_path(video_path), **kwargs)
+        try:
+            behav_set = journal.restore(video_path, max_frames)
+        except OSError as e:
+            logger.warning("Annotation journal disabled: %s", e)
+            return BehavInfo(video_path, max_frames), None
+        return behav_set, journal
+
+    def _snapshot_path(self):
+        return os.path.join(self.session_dir, SNAPSHOT_NAME)
+
+    def _segment_path(self, generation):
+        return os.path.join(self.session_dir, JOURNAL_PREFIX + str(generation))
+
+    def _segments(self):
+        generations = []
+        for name in os.listdir(self.session_dir):
+            if name.startswith(JOURNAL_PREFIX) and name[len(JOURNAL_PREFIX):].isdigit():
+                generations.append(int(name[len(JOURNAL_PREFIX):]))
+        return sorted(generations)
+
+    def restore(self, video_path, max_frames):
+        # snapshot + replay of the segments it does not cover
+        os.makedirs(self.session_dir, exist_ok=True)
+
+        snapshot_generation = 0
+        if os.path.exists(self._snapshot_path()):
+            header, _ = read_header(self._snapshot_path())
+            snapshot_generation = header["meta"].get("journal_generation", 0)
+            # read into memory, compaction replaces the file
+            behav_set = BehavInfo.load(self._snapshot_path(), mmap=False)
+        else:
+            behav_set = BehavInfo(video_path, max_frames)
+
+        generations = self._segments()
+        num_replayed = 0
+        for generation in generations:
+            if generation < snapshot_generation: # left over from an interrupted compaction
+                os.remove(self._segment_path(generation))
+            else:
+                num_replayed += self._replay(self._segment_path(generation), behav_set)
+        if num_replayed:
+            logger.info("Restored %d annotation changes from %s", num_replayed, self.session_dir)
+
+        # never append after a possibly torn record: start a new segment
+        self.generation = max(generations + [snapshot_generation - 1]) + 1
+        self._fp = open(self._segment_path(self.generation), "ab", buffering=0)
+        _fsync_dir(self.session_dir)
+        self._sync_thread.start()
+
+        self.attach(behav_set)
+        return behav_set
+
+    @staticmethod
+    def _replay(path, behav_set):
+        num_records = 0
+        with open(path, "rb") as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError: # torn write at the crash point
+                    break
+                try:
+                    apply_record(behav_set, record)
+                except (KeyError, ValueError) as e:
+                    logger.warning("Skipped journal record %s: %s", record, e)
+                    continue
+                num_records += 1
+        return num_records
+
+    def attach(self, behav_set):
+        if self.behav_set is not None and self.behav_set is not behav_set:
+            self.behav_set.journal = None
+        self.behav_set = behav_set
+        behav_set.journal = self
+
+    def append(self, op, **fields):
+        line = json.dumps({"op": op, **fields}, separators=(",", ":")) + "\n"
+        with self._cond:
+            self._fp.write(line.encode("utf-8"))
+            self._dirty = True
+            self._cond.notify()
+        self.num_records += 1
+        if (self.num_records >= self.compact_every or
+            time.monotonic() - self.last_compaction >= self.compact_interval):
+            self.compact()
+
+    def _sync_loop(self):
+        while True:
+            with self._cond:
+                while self._active and not self._dirty:
+                    self._cond.wait()
+                if not self._dirty:
+                    break
+                self._dirty = False
+                # the segment may be rotated while syncing, sync a duplicate descriptor
+                fd = os.dup(self._fp.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _copy_state(self):
+        behav_info = {name: dict(info) for name, info in self.behav_set.behav_info.items()}
+        return (self.behav_set.video_path, self.behav_set.max_frames, behav_info,
+                self.behav_set.serialized_frames())
+
+    def compact(self, wait=False):
+        """
+        Snapshot the current state in the background and drop the journal
+        segments it covers. The records appended from now on go to a new segment.
+        """
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            if not wait:
+                return
+            self._compact_thread.join()
+
+        state = self._copy_state()
+        with self._cond:
+            old_fp = self._fp
+            self.generation += 1
+            self._fp = open(self._segment_path(self.generation), "ab", buffering=0)
+        self.num_records = 0
+        self.last_compaction = time.monotonic()
+
+        self._compact_thread = threading.Thread(target=self._write_snapshot,
+                                                args=(old_fp, state, self.generation),
+                                                daemon=True)
+        self._compact_thread.start()
+        if wait:
+            self._compact_thread.join()
+
+    def _write_snapshot(self, old_fp, state, generation):
+        os.fsync(old_fp.fileno())
+        old_fp.close()
+
+        video_path, max_frames, behav_info, behav_frames = state
+        write_binary(self._snapshot_path(), video_path, max_frames, behav_info, behav_frames,
+                     meta={"journal_generation": generation}, sync=True)
+        _fsync_dir(self.session_dir)
+
+        for old_generation in self._segments():
+            if old_generation < generation:
+                try:
+                    os.remove(self._segment_path(old_generation))
+                except FileNotFoundError: # removed by another compaction of the session
+                    pass
+
+    def close(self):
+        if self.behav_set is not None:
+            self.compact(wait=True)
+            self.behav_set.journal = None
+        with self._cond:
+            self._active = False
+            self._cond.notify()
+        self._sync_thread.join()
+        self._fp.close()
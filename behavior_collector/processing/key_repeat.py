@@ -0,0 +1,65 @@
+import time
+
+
+STEP_SIZES = ( # (label, frames, seconds) moved per step
+    ("1 frame", 1, 0),
+    ("10 frames", 10, 0),
+    ("1 s", 0, 1),
+    ("10 s", 0, 10),
+)
+REPEAT_DELAY = 0.3 # s held before the key starts repeating
+REPEAT_RATE = 10 # steps per second once repeating
+REPEAT_ACCEL = 1.0 # added to the rate multiplier per second held
+MAX_REPEAT_SPEEDUP = 8 # rate multiplier reached after holding for a while
+
+
+def step_frames(index, fps):
+    _, frames, seconds = STEP_SIZES[index]
+    return frames or max(round(seconds * fps), 1)
+
+
+class KeyRepeat:
+    """
+    Target frame of a held navigation key, derived from how long it is held.
+
+    Pressing the key moves one step. After REPEAT_DELAY the target advances
+    continuously at REPEAT_RATE steps/s, accelerating up to
+    MAX_REPEAT_SPEEDUP times that. The auto-repeat events of the OS are not
+    counted: the caller samples `target()` once per display refresh and only
+    that frame is shown, so held keys never build up a backlog, and motion
+    stops at `release()`.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.direction = 0 # 1 forward, -1 backward, 0 when no key is held
+        self.frame0 = 0
+        self.step = 1
+        self.t0 = 0.
+
+    @property
+    def held(self):
+        return self.direction != 0
+
+    def press(self, direction, frame, step):
+        self.direction = direction
+        self.frame0 = frame
+        self.step = step
+        self.t0 = self.clock()
+        return self.target()
+
+    def release(self):
+        self.direction = 0
+
+    @staticmethod
+    def steps(held_time):
+        # steps taken after holding for held_time seconds, the first one on press
+        t = held_time - REPEAT_DELAY
+        if t <= 0:
+            return 1
+        t_max = (MAX_REPEAT_SPEEDUP - 1) / REPEAT_ACCEL # end of the acceleration
+        ramp = min(t, t_max)
+        distance = ramp + REPEAT_ACCEL * ramp**2 / 2 + MAX_REPEAT_SPEEDUP * max(t - t_max, 0)
+        return 1 + int(REPEAT_RATE * distance)
+
+    def target(self):
+        return self.frame0 + self.direction * self.step * self.steps(self.clock() - self.t0)
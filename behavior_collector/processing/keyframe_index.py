@@ -0,0 +1,103 @@
+import os
+import cv2
+import numpy as np
+
+
+INDEX_SUFFIX = ".keyframes.npz"
+
+
+def _video_signature(video_path):
+    stat = os.stat(video_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def scan_packets(video_path):
+    """
+    Iterate over the packets of a video without decoding them.
+
+    Yields (is_keyframe, pts_msec) per frame. Requires an OpenCV build with the
+    FFmpeg backend and raw stream support; yields nothing otherwise.
+    """
+    if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+        return
+
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    try:
+        if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+            return
+        while cap.grab():
+            yield (bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME)),
+                   cap.get(cv2.CAP_PROP_POS_MSEC))
+    finally:
+        cap.release()
+
+
+class KeyframeIndex:
+    def __init__(self, keyframes, total_frames):
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)
+        self.total_frames = total_frames
+
+    def keyframe_before(self, nframe):
+        idx = np.searchsorted(self.keyframes, nframe, side="right") - 1
+        return int(self.keyframes[max(idx, 0)])
+
+    def gop_range(self, nframe):
+        # [start, end) of the GOP that contains nframe
+        idx = max(np.searchsorted(self.keyframes, nframe, side="right") - 1, 0)
+        start = int(self.keyframes[idx])
+        if idx + 1 < len(self.keyframes):
+            return start, int(self.keyframes[idx+1])
+        return start, self.total_frames
+
+    @staticmethod
+    def sidecar_path(video_path):
+        return video_path + INDEX_SUFFIX
+
+    @staticmethod
+    def build(video_path):
+        keyframes = []
+        total_frames = 0
+        for is_key, _ in scan_packets(video_path):
+            if is_key:
+                keyframes.append(total_frames)
+            total_frames += 1
+
+        if not keyframes:
+            return None
+        return KeyframeIndex(keyframes, total_frames)
+
+    @staticmethod
+    def load(video_path):
+        path = KeyframeIndex.sidecar_path(video_path)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                if tuple(data["signature"]) != _video_signature(video_path):
+                    return None # video changed since the index was built
+                return KeyframeIndex(data["keyframes"], int(data["total_frames"]))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, video_path):
+        path = self.sidecar_path(video_path)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as fp:
+                np.savez(fp, keyframes=self.keyframes,
+                         total_frames=self.total_frames,
+                         signature=np.array(_video_signature(video_path), dtype=np.int64))
+            os.replace(tmp_path, path)
+        except OSError: # e.g. read-only video directory, keep the index in memory only
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def load_or_build(video_path):
+        index = KeyframeIndex.load(video_path)
+        if index is None:
+            index = KeyframeIndex.build(video_path)
+            if index is not None:
+                index.save(video_path)
+        return index
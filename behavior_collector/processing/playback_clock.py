@@ -0,0 +1,98 @@
+import time
+from collections import deque
+
+
+PLAYBACK_SPEEDS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+MAX_DISPLAY_FPS = 60 # frames put on screen per second at most
+FPS_WINDOW = 1.0 # s of presented frames used for the achieved fps
+
+
+def prefetch_stride(fps, speed):
+    # every stride-th frame is shown when playing faster than the display rate
+    return max(1, int(fps * speed // MAX_DISPLAY_FPS))
+
+
+class PlaybackClock:
+    """
+    Playback position derived from a monotonic clock.
+
+    While playing, the frame to show is computed from the time elapsed since
+    play started, never by counting timer ticks, so late ticks or slow
+    decoding make playback drop frames instead of drifting. At slow speeds the
+    same frame is returned until the next one is due. Above MAX_DISPLAY_FPS
+    only frames on a stride grid are shown, so the frames in between never
+    need to be decoded. With a TimestampIndex the frames follow their
+    presentation times, so variable frame rate videos play in real time.
+    """
+    def __init__(self, fps, speed=1.0, clock=time.monotonic):
+        self.fps = fps
+        self.timestamps = None
+        self.speed = speed
+        self.clock = clock
+        self.playing = False
+        self.frame0 = 0
+        self.t0 = 0.
+        self.presented = deque() # (time, frame) of the frames put on screen
+
+    @property
+    def stride(self):
+        return prefetch_stride(self.fps, self.speed)
+
+    def tick_interval(self):
+        # seconds between two frames on screen
+        return self.stride / (self.fps * self.speed)
+
+    def start(self, nframe):
+        self.frame0 = nframe
+        self.t0 = self.clock()
+        self.playing = True
+        self.presented.clear()
+
+    def stop(self):
+        self.playing = False
+
+    def set_speed(self, speed):
+        # continue from the current position at the new speed
+        if self.playing:
+            self.frame0 = self.position()
+            self.t0 = self.clock()
+        self.speed = speed
+        self.presented.clear()
+
+    def position(self):
+        # exact (fractional) playback position in frames
+        elapsed = (self.clock() - self.t0) * self.speed
+        if self.timestamps is not None:
+            t = self.timestamps.time_of(int(self.frame0)) + elapsed
+            if t >= self.timestamps.end_time:
+                return self.timestamps.total_frames
+            return max(self.timestamps.frame_at(t), 0)
+        return self.frame0 + elapsed * self.fps
+
+    def frame(self):
+        nframe = int(self.position())
+        return nframe - nframe % self.stride
+
+    def record_presented(self, nframe):
+        now = self.clock()
+        self.presented.append((now, nframe))
+        while self.presented and self.presented[0][0] < now - FPS_WINDOW:
+            self.presented.popleft()
+
+    def target_fps(self):
+        # distinct frames per second that should reach the screen
+        return self.fps * self.speed / self.stride
+
+    def achieved_fps(self):
+        if len(self.presented) < 2:
+            return 0.
+        dt = self.presented[-1][0] - self.presented[0][0]
+        return (len(self.presented) - 1) / dt if dt > 0 else 0.
+
+    def achieved_speed(self):
+        # playhead advance relative to real time
+        if len(self.presented) < 2:
+            return 0.
+        dt = self.presented[-1][0] - self.presented[0][0]
+        dframe = self.presented[-1][1] - self.presented[0][1]
+        return dframe / (dt * self.fps) if dt > 0 else 0.
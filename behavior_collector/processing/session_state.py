@@ -0,0 +1,42 @@
+"""
+Last GUI session (videos, annotation file, playhead, zoom) kept in a small
+JSON file, so that the next launch reopens where the previous one stopped.
+"""
+import os
+import json
+
+from .tracing import get_logger
+
+
+STATE_NAME = "last_session.json"
+
+logger = get_logger("session_state")
+
+
+def default_state_path():
+    base = os.environ.get("XDG_STATE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".local", "state"))
+    return os.path.join(base, "behavior_collector", STATE_NAME)
+
+
+def load_state(path=None):
+    # {} if there is no usable state
+    path = path or default_state_path()
+    try:
+        with open(path) as fp:
+            state = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def save_state(state, path=None):
+    path = path or default_state_path()
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w") as fp:
+            json.dump(state, fp, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not save the session state: %s", e)
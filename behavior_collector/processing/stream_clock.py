@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class StreamTiming:
+    """
+    Frame timing of one video stream. offset is the master time [s] at which
+    the stream's first frame is shown, so a camera that started recording
+    late has a positive offset. With a TimestampIndex the frames are placed
+    at their presentation times instead of multiples of 1 / fps.
+    """
+    def __init__(self, fps, total_frames, offset=0.0, timestamps=None):
+        self.fps = fps
+        self.total_frames = total_frames
+        self.offset = offset
+        self.timestamps = timestamps
+
+    def frame_at(self, t):
+        # frame on screen at master time t, None before the start or after the end
+        if self.timestamps is not None:
+            if t - self.offset >= self.timestamps.end_time:
+                return None
+            nframe = self.timestamps.frame_at(t - self.offset)
+        else:
+            nframe = int(np.floor((t - self.offset) * self.fps + 1e-6))
+        if 0 <= nframe < self.total_frames:
+            return nframe
+        return None
+
+    def time_of(self, nframe):
+        if self.timestamps is not None:
+            return self.timestamps.time_of(nframe) + self.offset
+        return nframe / self.fps + self.offset
+
+
+class StreamClock:
+    """
+    Shared clock of several video streams. The master timeline counts frames
+    of the master stream (the annotated video): master frame m is shown at
+    time m / master_fps + master_offset (or its presentation time), and every
+    stream shows the frame it has at that time.
+    """
+    def __init__(self, master_key=0):
+        self.master_key = master_key
+        self.streams = {}
+
+    def add_stream(self, key, fps, total_frames, offset=0.0, timestamps=None):
+        self.streams[key] = StreamTiming(fps, total_frames, offset, timestamps)
+
+    def remove_stream(self, key):
+        self.streams.pop(key, None)
+
+    def set_offset(self, key, offset):
+        self.streams[key].offset = offset
+
+    def master_time(self, master_frame):
+        master = self.streams.get(self.master_key)
+        if master is None:
+            return None
+        return master.time_of(master_frame)
+
+    def frames_at(self, master_frame):
+        # {stream key: frame shown at master_frame, or None}
+        t = self.master_time(master_frame)
+        frames = {}
+        for key, timing in self.streams.items():
+            if t is None: # no master yet, every stream runs on its own frame count
+                frames[key] = master_frame if 0 <= master_frame < timing.total_frames else None
+            else:
+                frames[key] = timing.frame_at(t)
+        return frames
@@ -0,0 +1,132 @@
+import os
+import json
+import threading
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .keyframe_index import _video_signature
+from .decoders import open_decoder
+
+
+THUMBS_SUFFIX = ".thumbs.npy"
+META_SUFFIX = ".thumbs.json"
+THUMB_HEIGHT = 72 # pixels
+MAX_THUMBS = 1000 # per video, the step grows with the video length
+FLUSH_EVERY = 32 # thumbnails written between two progress checkpoints
+
+
+class ThumbnailIndex:
+    """
+    Low resolution frames sampled every `step` frames, for scrubbing previews.
+
+    The thumbnails live in a memory-mapped (num_thumbs, h, w, 3) uint8 sidecar
+    next to the video, with a small JSON file that records how many of them
+    are written. `start` fills the index on a background thread with its own
+    decoder, checkpointing every FLUSH_EVERY thumbnails, so an interrupted
+    build resumes from the last checkpoint the next time the video is opened.
+    `get` never touches a decoder: it returns the closest thumbnail built so
+    far.
+    """
+    def __init__(self, video_path, total_frames, frame_size, step=None, height=THUMB_HEIGHT):
+        self.video_path = video_path
+        self.step = step or max(-(-total_frames // MAX_THUMBS), 1)
+        width = max(round(frame_size[0] * height / frame_size[1]), 1)
+        self.size = (width, height)
+        self.done = 0 # thumbnails [0, done) are valid
+        self.complete = False
+        self.persistent = True
+
+        num_thumbs = max(-(-total_frames // self.step), 1)
+        self.meta = {
+            "signature": list(_video_signature(video_path)),
+            "step": self.step,
+            "shape": [num_thumbs, height, width, 3],
+        }
+        self.thumbs = self._open()
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def sidecar_paths(video_path):
+        return video_path + THUMBS_SUFFIX, video_path + META_SUFFIX
+
+    def _open(self):
+        thumbs_path, meta_path = self.sidecar_paths(self.video_path)
+        shape = tuple(self.meta["shape"])
+        try:
+            with open(meta_path) as fp:
+                saved = json.load(fp)
+            if all(saved.get(key) == value for key, value in self.meta.items()):
+                thumbs = np.load(thumbs_path, mmap_mode="r+")
+                if thumbs.shape == shape and thumbs.dtype == np.uint8:
+                    self.done = saved["done"]
+                    self.complete = saved["complete"]
+                    return thumbs
+        except (OSError, ValueError, KeyError):
+            pass # missing, stale or corrupt: rebuild
+
+        try:
+            thumbs = open_memmap(thumbs_path, mode="w+", dtype=np.uint8, shape=shape)
+            self._checkpoint()
+        except OSError: # e.g. read-only video directory, keep the thumbnails in memory only
+            self.persistent = False
+            thumbs = np.zeros(shape, dtype=np.uint8)
+        return thumbs
+
+    def _checkpoint(self):
+        if not self.persistent:
+            return
+        _, meta_path = self.sidecar_paths(self.video_path)
+        tmp_path = meta_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as fp:
+                json.dump(dict(self.meta, done=self.done, complete=self.complete), fp)
+            os.replace(tmp_path, meta_path)
+        except OSError:
+            self.persistent = False
+
+    def get(self, nframe):
+        """(frame number, thumbnail) closest to nframe, or None if it is not built yet"""
+        i = max(int(round(nframe / self.step)), 0)
+        if i >= self.done:
+            if not self.complete or self.done == 0:
+                return None # still building, the nearest built one is another frame
+            i = self.done - 1 # the video ended before the last thumbnail
+        return i * self.step, self.thumbs[i]
+
+    def build(self, keyframes=None, backend="opencv", timestamps=None):
+        # decode the missing thumbnails in order, returns early if stopped
+        decoder = open_decoder(self.video_path, backend, timestamps=timestamps)
+        try:
+            while not self.complete and not self.stop_event.is_set():
+                end = min(self.done + FLUSH_EVERY, len(self.thumbs))
+                for i in range(self.done, end):
+                    nframe = i * self.step
+                    decoder.seek(nframe, keyframes)
+                    thumb = decoder.read(self.size)
+                    if thumb is None: # the video is shorter than reported
+                        end = i
+                        self.complete = True
+                        break
+                    self.thumbs[i] = thumb
+                if isinstance(self.thumbs, np.memmap):
+                    self.thumbs.flush()
+                self.done = end
+                self.complete = self.complete or end == len(self.thumbs)
+                self._checkpoint()
+        finally:
+            decoder.release()
+
+    def start(self, keyframes=None, backend="opencv", timestamps=None):
+        if self.complete or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.build, args=(keyframes, backend, timestamps),
+                                       daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,124 @@
+"""
+Presentation time of every frame of a video.
+
+Recordings with a variable frame rate or dropped frames cannot be addressed
+with frame / fps. The packets are scanned once (no decoding, together with
+the keyframes) and the sorted PTS are kept in a <video>.timestamps.npy
+sidecar that is memory-mapped when the video is opened again. Time and frame
+lookups are binary searches.
+"""
+import os
+import json
+import numpy as np
+
+from .keyframe_index import KeyframeIndex, scan_packets, _video_signature
+
+
+TIMESTAMPS_SUFFIX = ".timestamps.npy"
+META_SUFFIX = ".timestamps.json"
+TIME_TOLERANCE = 1e-4 # s, timestamps closer than this are the same instant
+RATE_TOLERANCE = 0.01 # relative spread of the frame intervals of a constant rate video
+
+
+class TimestampIndex:
+    def __init__(self, timestamps):
+        # seconds from the start of the stream, ascending, one per frame
+        self.timestamps = timestamps
+        self.total_frames = len(timestamps)
+        if self.total_frames > 1 and timestamps[-1] > timestamps[0]:
+            self.fps = (self.total_frames - 1) / float(timestamps[-1] - timestamps[0])
+        else:
+            self.fps = 0.
+        self.end_time = float(timestamps[-1]) + 1 / self.fps if self.fps else float(timestamps[-1])
+        self._constant_rate = None
+
+    @property
+    def constant_rate(self):
+        if self._constant_rate is None:
+            intervals = np.diff(self.timestamps)
+            self._constant_rate = bool(len(intervals) == 0 or np.ptp(intervals)
+                                       <= RATE_TOLERANCE * np.median(intervals))
+        return self._constant_rate
+
+    def time_of(self, nframe):
+        # presentation time of nframe, end_time for total_frames
+        if nframe >= self.total_frames:
+            return self.end_time
+        return float(self.timestamps[max(nframe, 0)])
+
+    def times_of(self, frames):
+        frames = np.asarray(frames)
+        times = self.timestamps[np.clip(frames, 0, self.total_frames - 1)]
+        return np.where(frames >= self.total_frames, self.end_time, times)
+
+    def frame_at(self, t):
+        # frame on screen at time t, -1 before the first one
+        return int(np.searchsorted(self.timestamps, t + TIME_TOLERANCE, side="right")) - 1
+
+    def frames_at(self, times):
+        return np.searchsorted(self.timestamps, np.asarray(times) + TIME_TOLERANCE, side="right") - 1
+
+    @staticmethod
+    def sidecar_paths(video_path):
+        return video_path + TIMESTAMPS_SUFFIX, video_path + META_SUFFIX
+
+    @staticmethod
+    def from_pts(pts_msec):
+        # packets come in decoding order, presentation order is sorted by PTS
+        return TimestampIndex(np.sort(np.asarray(pts_msec, dtype=np.float64)) / 1e3)
+
+    @staticmethod
+    def build(video_path):
+        pts = [pts_msec for _, pts_msec in scan_packets(video_path)]
+        return TimestampIndex.from_pts(pts) if pts else None
+
+    @staticmethod
+    def load(video_path):
+        timestamps_path, meta_path = TimestampIndex.sidecar_paths(video_path)
+        try:
+            with open(meta_path) as fp:
+                meta = json.load(fp)
+            if tuple(meta["signature"]) != _video_signature(video_path):
+                return None # video changed since the index was built
+            timestamps = np.load(timestamps_path, mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        if timestamps.ndim != 1 or len(timestamps) != meta["total_frames"] or len(timestamps) == 0:
+            return None
+        return TimestampIndex(timestamps)
+
+    def save(self, video_path):
+        timestamps_path, meta_path = self.sidecar_paths(video_path)
+        try:
+            np.save(timestamps_path, np.asarray(self.timestamps))
+            tmp_path = meta_path + ".tmp"
+            with open(tmp_path, "w") as fp:
+                json.dump({"signature": list(_video_signature(video_path)),
+                           "total_frames": self.total_frames}, fp)
+            os.replace(tmp_path, meta_path) # written last, the index is valid once it exists
+        except OSError: # e.g. read-only video directory, keep the index in memory only
+            pass
+
+
+def load_or_build_indexes(video_path):
+    """
+    (KeyframeIndex, TimestampIndex) of a video, either None if the packets
+    cannot be scanned. Missing sidecars are built from a single scan.
+    """
+    keyframes = KeyframeIndex.load(video_path)
+    timestamps = TimestampIndex.load(video_path)
+    if keyframes is not None and timestamps is not None:
+        return keyframes, timestamps
+
+    key_frames, pts = [], []
+    for nframe, (is_key, pts_msec) in enumerate(scan_packets(video_path)):
+        if is_key:
+            key_frames.append(nframe)
+        pts.append(pts_msec)
+    if keyframes is None and key_frames:
+        keyframes = KeyframeIndex(key_frames, len(pts))
+        keyframes.save(video_path)
+    if timestamps is None and pts:
+        timestamps = TimestampIndex.from_pts(pts)
+        timestamps.save(video_path)
+    return keyframes, timestamps
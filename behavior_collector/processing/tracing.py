@@ -0,0 +1,168 @@
+"""
+Lightweight per-stage timing of the frame pipeline and rate-limited logging.
+
+`tracer.span(stage)` times a block (decode, resize, pixmap upload, timeline
+redraw, ...). Every stage keeps its latest durations in a fixed-size ring
+buffer, so percentiles are available at any time at a constant memory cost.
+While recording, the spans are also kept as Chrome trace events
+(chrome://tracing, Perfetto) for offline analysis.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+import numpy as np
+
+
+TRACE_CAPACITY = 4096 # durations kept per stage
+MAX_TRACE_EVENTS = 500_000 # spans kept while recording, the oldest are dropped
+LOG_PERIOD = 1.0 # s, window of the log rate limit
+LOG_BURST = 5 # records per call site and window
+
+
+class StageStats:
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.durations = np.zeros(capacity) # s, ring buffer
+        self.count = 0
+
+    def add(self, duration):
+        self.durations[self.count % len(self.durations)] = duration
+        self.count += 1
+
+    def recent(self):
+        return self.durations[:min(self.count, len(self.durations))]
+
+    def summary(self):
+        durations = self.recent() * 1e3
+        if durations.size == 0:
+            return {"count": 0}
+        p50, p99 = np.percentile(durations, [50, 99])
+        return {"count": self.count, "mean_ms": float(durations.mean()),
+                "p50_ms": float(p50), "p99_ms": float(p99), "max_ms": float(durations.max())}
+
+
+class Tracer:
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.capacity = capacity
+        self.stages = {} # stage name -> StageStats
+        self.events = None # deque of Chrome trace events while recording
+        self.lock = threading.Lock()
+        self.t0 = time.perf_counter()
+
+    def record(self, stage, start, end, args=None):
+        # start and end are time.perf_counter() values
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats(self.capacity)
+            stats.add(end - start)
+            if self.events is not None:
+                event = {"name": stage, "ph": "X", "pid": os.getpid(),
+                         "tid": threading.get_ident(),
+                         "ts": (start - self.t0) * 1e6, "dur": (end - start) * 1e6}
+                if args:
+                    event["args"] = args
+                self.events.append(event)
+
+    @contextmanager
+    def span(self, stage, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, start, time.perf_counter(), args)
+
+    def traced(self, stage):
+        # decorator form of span
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(stage, start, time.perf_counter())
+            return wrapper
+        return decorator
+
+    def count(self, stage):
+        # spans recorded for stage so far
+        stats = self.stages.get(stage)
+        return stats.count if stats is not None else 0
+
+    def summary(self):
+        with self.lock:
+            return {stage: stats.summary() for stage, stats in sorted(self.stages.items())}
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+
+    def start_recording(self, max_events=MAX_TRACE_EVENTS):
+        with self.lock:
+            self.events = deque(maxlen=max_events)
+
+    def stop_recording(self):
+        with self.lock:
+            events, self.events = self.events, None
+        return list(events or [])
+
+    def export_chrome_trace(self, path, events=None):
+        """Write the recorded spans (or events) as a Chrome trace JSON file"""
+        if events is None:
+            with self.lock:
+                events = list(self.events or [])
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                     "args": {"name": names.get(tid, str(tid))}}
+                    for tid in {event["tid"] for event in events}]
+        with open(path, "w") as fp:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, fp)
+
+
+tracer = Tracer()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `burst` records per call site through every `period` seconds.
+    The next record let through reports how many were suppressed. Only the
+    chatty levels up to `max_level` are limited, warnings and errors always
+    pass.
+    """
+    def __init__(self, period=LOG_PERIOD, burst=LOG_BURST, max_level=logging.INFO):
+        super().__init__()
+        self.period = period
+        self.burst = burst
+        self.max_level = max_level
+        self.sites = {} # (path, line) -> [window start, records, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.setdefault((record.pathname, record.lineno), [now, 0, 0])
+            if now - site[0] >= self.period:
+                site[0], site[1] = now, 0
+            site[1] += 1
+            if site[1] > self.burst:
+                site[2] += 1
+                return False
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.msg = "%s (%d similar messages suppressed)"%(record.msg, suppressed)
+        return True
+
+
+def get_logger(name):
+    # logger of the behavior_collector hierarchy with the rate limit attached
+    logger = logging.getLogger("behavior_collector." + name)
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter())
+    return logger
@@ -1,210 +1,471 @@
-import cv2
 import threading
 import queue
 from numpy import ndarray
-from collections import deque
 import time
+from dataclasses import dataclass, field
 
-# from dataclasses import dataclass
+from .frame_cache import FrameRingBuffer
+from .timestamp_index import load_or_build_indexes
+from .decode_pool import DecodePool
+from .disk_cache import video_hash
+from .decoders import open_decoder
+from .tracing import tracer, get_logger
 
 
 IMAGE_BUFFER_SIZE = 100
+BUFFER_BEHIND = 40 # frames kept behind the playhead
+BUFFER_AHEAD = IMAGE_BUFFER_SIZE - BUFFER_BEHIND
+MAX_BUFFER_SIZE = 1000
+CACHE_BUDGET = 512 * 1024**2 # bytes of decoded frames kept in the ring buffer
 FORWARD_FRAME = -100
 BACKWARD_FRAME = -200
+DECODE_RETRIES = 3 # failed decodes of a frame before it is handled as the end of the video
 
+logger = get_logger("video_reader")
 
-def convert_frame(func):
-    def wrapper(*args, **kwargs):
-        frame = func(*args, **kwargs)
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    return wrapper
+
+def fit_display_size(frame_size, width, height):
+    # largest size with the frame's aspect ratio that fits in (width, height),
+    # None if the frame is not larger than that
+    frame_w, frame_h = frame_size
+    scale = min(width / frame_w, height / frame_h)
+    if scale >= 1:
+        return None
+    return max(int(frame_w * scale), 1), max(int(frame_h * scale), 1)
+
+
+def buffer_window(frame_size, channels=3, budget=CACHE_BUDGET):
+    # (n_behind, n_ahead) that fill budget bytes, at least IMAGE_BUFFER_SIZE frames
+    frame_bytes = frame_size[0] * frame_size[1] * channels
+    num_frames = min(max(budget // frame_bytes, IMAGE_BUFFER_SIZE), MAX_BUFFER_SIZE)
+    n_behind = num_frames * BUFFER_BEHIND // IMAGE_BUFFER_SIZE
+    return n_behind, num_frames - n_behind
+
+
+def open_indexed(reader, file_path, decoder):
+    # keyframe and timestamp indexes first (sidecars, or one packet scan), so
+    # that the decoder numbers every frame by its PTS from the first read
+    reader.keyframes, reader.timestamps = load_or_build_indexes(file_path)
+    reader.decoder = open_decoder(file_path, decoder, timestamps=reader.timestamps)
+    reader.total_frames = reader.decoder.total_frames
+    reader.fps = reader.decoder.fps # average rate, exact frame times in reader.timestamps
+    if reader.timestamps is not None:
+        # the timestamps replace the frame count and average rate of the container
+        reader.total_frames = reader.timestamps.total_frames
+        reader.fps = reader.timestamps.fps or reader.fps
+
+
+@dataclass
+class ReaderStats:
+    hits: int = 0
+    misses: int = 0
+    disk_hits: int = 0          # frames read back from the disk cache
+    frames_decoded: int = 0
+    lock_wait: float = 0.0      # time the caller spent waiting on reader locks [s]
+    decode_time: float = 0.0    # time spent inside the decoder [s]
+    idle_time: float = 0.0      # time the prefetch thread slept on the condition [s]
+    idle_cpu: float = 0.0       # CPU time burned by the prefetch thread while idle [s]
+    reader_cpu: float = 0.0     # total CPU time of the prefetch thread [s]
+    idle_since: float = None    # set while the prefetch thread is sleeping
+    started: float = field(default_factory=time.perf_counter)
+
+    def summary(self):
+        now = time.perf_counter()
+        wall = now - self.started
+        idle_time = self.idle_time
+        if self.idle_since is not None:
+            idle_time += now - self.idle_since
+        requests = self.hits + self.misses
+        return {
+            "wall_time": wall,
+            "hit_rate": self.hits / requests if requests else 0.,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "frames_decoded": self.frames_decoded,
+            "lock_wait_ms": self.lock_wait * 1e3,
+            "decode_ms_per_frame": self.decode_time * 1e3 / max(self.frames_decoded, 1),
+            "reader_idle_ratio": idle_time / wall if wall > 0 else 0.,
+            "reader_idle_cpu": self.idle_cpu,
+            "reader_cpu_usage": self.reader_cpu / wall if wall > 0 else 0.,
+        }
 
 
 class ThreadVideoReader:
-    def __init__(self, file_path):
-        self.cap = cv2.VideoCapture(file_path)
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = int(self.cap.get(cv2.CAP_PROP_FPS))
+    def __init__(self, file_path, n_behind=BUFFER_BEHIND, n_ahead=BUFFER_AHEAD,
+                 cache_budget=CACHE_BUDGET, decode_workers=0, disk_cache=None, decoder="auto"):
+        self.file_path = file_path
+        self.cache_budget = cache_budget
+        self.disk_cache = disk_cache # DiskFrameCache shared with the other readers, or None
+        self.disk_key = video_hash(file_path) if disk_cache is not None else None
+        self.decode_workers = decode_workers # worker processes for batch prefetch, 0/1: none
+        self.pool = None
+        open_indexed(self, file_path, decoder) # backend name or "auto"
+        self.frame_size = self.decoder.frame_size
+        self.display_size = None # (width, height) of cached frames, None for full resolution
 
         self.cur_frame = 0
-        self.buffer = deque()
-        self.buffer_range = [0, 0]  # [start_index, end_index]
+        self.buffer = FrameRingBuffer(n_behind, n_ahead)
         self.buffer_lock = threading.Lock()
+        self.buffer_cond = threading.Condition(self.buffer_lock)
 
+        # the decoder has its own lock so that decoding never holds buffer_lock
+        self.cap_lock = threading.Lock()
+
+        self.stats = ReaderStats()
         self.read_thread_active = True
         self.read_thread = threading.Thread(target=self._reader_loop, daemon=True)
         self.read_thread.start()
         
     def _reader_loop(self):
-        while self.read_thread_active:
-            with self.buffer_lock:
-                if self.buffer_range[1] - self.cur_frame >= IMAGE_BUFFER_SIZE//2:
-                    continue
+        failed_frame, failures = None, 0
+        while True:
+            with self.buffer_cond:
+                t0, cpu0 = time.perf_counter(), time.thread_time()
+                self.stats.idle_since = t0
+                nframe = self.buffer.next_missing(self.total_frames)
+                while self.read_thread_active and nframe is None:
+                    self.buffer_cond.wait()
+                    nframe = self.buffer.next_missing(self.total_frames)
+                self.stats.idle_since = None
+                self.stats.idle_time += time.perf_counter() - t0
+                self.stats.idle_cpu += time.thread_time() - cpu0
                 
-                if self.buffer_range[1] < self.total_frames - 1:
-                    ret, frame = self.cap.read()
-                    if not ret:
-                        continue
-                    
-                    if self.buffer_range[1] - self.buffer_range[0] >= IMAGE_BUFFER_SIZE:
-                        self.buffer.append(frame)
-                        self.buffer.popleft()
-                        self.buffer_range = [self.buffer_range[0]+1, self.buffer_range[1]+1]
-                    else:
-                        self.buffer.append(frame)
-                        self.buffer_range[1] += 1
-                    
-                    print("Cached, range: %d-%d"%(self.buffer_range[0], self.buffer_range[1]))   
-                    
-            time.sleep(0.01)
-
-    def _get_frame_from_buffer(self, nframe):
-        with self.buffer_lock:
-            if self.buffer_range[0] <= nframe < self.buffer_range[1]:
-                return self.buffer[nframe - self.buffer_range[0]]
-        return None
-            
-    def move_next(self):
-        if self.cur_frame + 1 >= self.total_frames:
+                if not self.read_thread_active:
+                    break
+                batch = self._pool_batch()
+
+            if batch is not None:
+                try:
+                    self._decode_batch(batch)
+                except Exception:
+                    logger.exception("Decode pool failed, decoding in the reader thread")
+                    self._close_pool()
+                continue
+            if self._load_cached(nframe) is not None:
+                continue
+            try:
+                frame = self._decode(nframe) # dropped if the window moved away
+            except Exception:
+                logger.exception("Decoding frame %d failed", nframe)
+                with self.cap_lock:
+                    self.decoder.pos = -1 # position unknown, seek again
+                failures = failures + 1 if nframe == failed_frame else 1
+                failed_frame = nframe
+                if failures < DECODE_RETRIES:
+                    continue
+                frame = None
+            with self.buffer_cond:
+                if frame is None: # decoder ran out of frames earlier than reported
+                    self.total_frames = min(self.total_frames, nframe)
+                self.buffer_cond.notify_all()
+            self.stats.reader_cpu = time.thread_time()
+    
+    def _decode(self, nframe, start=None):
+        # Decode nframe into the buffer, frames from start up to nframe are
+        # decoded on the way and cached as well. The decoder returns its
+        # scratch array, only touched under cap_lock, so the returned frame is
+        # the buffer view (or a copy if nframe fell out of the window while
+        # decoding).
+        start = nframe if start is None else start
+        frame = decoded = None
+        t0 = time.perf_counter()
+        with self.cap_lock:
+            t1 = time.perf_counter()
+            with tracer.span("reader.seek"):
+                self.decoder.seek(start, self.keyframes)
+            for n in range(start, nframe + 1):
+                with tracer.span("reader.decode"): # includes the scaling to display_size
+                    decoded = self.decoder.read(self.display_size)
+                if decoded is None:
+                    break
+                self.stats.frames_decoded += 1
+                self._store_cached(n, decoded)
+                with self.buffer_cond:
+                    if self.buffer.put(n, decoded):
+                        frame = self.buffer.get(n)
+                    elif n == nframe:
+                        frame = decoded.copy()
+        t2 = time.perf_counter()
+        
+        if threading.current_thread() is not self.read_thread:
+            self.stats.lock_wait += t1 - t0
+        self.stats.decode_time += t2 - t1
+        return frame if decoded is not None else None
+    
+    def _pool_batch(self):
+        # frames ahead worth handing to the decode pool: the grid frames of
+        # fast playback, or a window ahead that spans several GOPs. Called
+        # with buffer_lock held
+        if self.decode_workers < 2:
             return None
-        self.cur_frame += 1
-        frame = self._get_frame_from_buffer(self.cur_frame)
+        frames = self.buffer.missing_ahead(self.total_frames)
+        if len(frames) < 2:
+            return None
+        if self.buffer.stride == 1 and (self.keyframes is None or
+                self.keyframes.keyframe_before(int(frames[-1])) <= frames[0]):
+            return None # one GOP: decoding it in this thread is cheaper
+        return frames
+
+    def _decode_batch(self, frames):
+        with self.buffer_cond:
+            size = self.display_size or self.frame_size
+            center = self.buffer.center
+        if self.disk_cache is not None:
+            frames = [nframe for nframe in frames if self._load_cached(nframe) is None]
+            if not frames:
+                return
+        if self.pool is None:
+            self.pool = DecodePool(self.file_path, num_workers=self.decode_workers,
+                                   backend=self.decoder.name, timestamps=self.timestamps)
+        t0 = time.perf_counter()
+        decoded = self.pool.decode(frames, size, self.keyframes)
+        try:
+            for nframe, frame in decoded:
+                with self.buffer_cond:
+                    if (not self.read_thread_active or size != (self.display_size or self.frame_size)
+                            or not center <= self.buffer.center <= frames[-1]):
+                        break # closed, resized or the playhead left the batch
+                    self.stats.frames_decoded += 1
+                    self._store_cached(nframe, frame, size)
+                    if self.buffer.put(nframe, frame):
+                        self.buffer_cond.notify_all()
+        finally:
+            decoded.close()
+        t1 = time.perf_counter()
+        self.stats.decode_time += t1 - t0
+        tracer.record("reader.pool_batch", t0, t1, {"frames": len(frames)})
+
+    def _load_cached(self, nframe):
+        # frame from the disk cache, put into the buffer; None if it is not on disk
+        if self.disk_cache is None:
+            return None
+        size = self.display_size or self.frame_size
+        try:
+            with tracer.span("reader.disk_read"):
+                frame = self.disk_cache.get(self.disk_key, size, nframe)
+        except Exception:
+            self._disk_cache_failed()
+            return None
+        if frame is None:
+            return None
+        self.stats.disk_hits += 1
+        with self.buffer_cond:
+            if size == (self.display_size or self.frame_size) and self.buffer.put(nframe, frame):
+                self.buffer_cond.notify_all()
+                return self.buffer.get(nframe)
+        return frame
+
+    def _store_cached(self, nframe, frame, size=None):
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.put(self.disk_key, size or self.display_size or self.frame_size,
+                                    nframe, frame)
+            except Exception:
+                self._disk_cache_failed()
+    
+    def _disk_cache_failed(self):
+        logger.exception("Disk cache failed, disabled for %s", self.file_path)
+        self.disk_cache = None
+    
+    def _close_pool(self):
+        # stop using the decode pool after a failure, the frames are decoded in this thread
+        pool, self.pool = self.pool, None
+        self.decode_workers = 0
+        if pool is not None:
+            try:
+                pool.close()
+            except Exception:
+                logger.exception("Closing the decode pool failed")
+
+    def set_display_size(self, width, height):
+        # cache frames scaled to fit (width, height); the cache is refilled
+        display_size = fit_display_size(self.frame_size, width, height)
+        with self.cap_lock, self.buffer_cond:
+            if display_size == self.display_size:
+                return
+            self.display_size = display_size
+            self.buffer.resize(*buffer_window(display_size or self.frame_size,
+                                              budget=self.cache_budget))
+            self.buffer.set_center(self.cur_frame)
+            self.buffer_cond.notify_all()
+    
+    def set_cache_budget(self, budget):
+        # bytes the ring buffer may hold, lowered when several streams share the memory
+        with self.cap_lock, self.buffer_cond:
+            if budget == self.cache_budget:
+                return
+            self.cache_budget = budget
+            self.buffer.resize(*buffer_window(self.display_size or self.frame_size,
+                                              budget=budget))
+            self.buffer.set_center(self.cur_frame)
+            self.buffer_cond.notify_all()
+    
+    def set_prefetch_stride(self, stride):
+        # prefetch only every stride-th frame, the others are skipped during fast playback
+        with self.buffer_cond:
+            self.buffer.stride = stride
+            self.buffer_cond.notify_all()
+    
+    def read_full_frame(self, nframe):
+        # full-resolution copy of nframe, bypassing the buffer
+        if not (0 <= nframe < self.total_frames):
+            return None
+        with self.cap_lock:
+            self.decoder.seek(nframe, self.keyframes)
+            frame = self.decoder.read()
+            if frame is not None:
+                frame = frame.copy() # the decoder reuses its array
+        self.stats.frames_decoded += 1
+        return frame
+    
+    @tracer.traced("reader.fetch")
+    def _fetch(self, nframe):
+        t0 = time.perf_counter()
+        with self.buffer_cond:
+            self.stats.lock_wait += time.perf_counter() - t0
+            backward = nframe < self.cur_frame
+            self.cur_frame = nframe
+            self.buffer.set_center(nframe)
+            self.buffer_cond.notify_all() # wake the reader to refill around the playhead
+            frame = self.buffer.get(nframe)
+            if frame is not None:
+                self.stats.hits += 1
+                return frame
+            self.stats.misses += 1
+        
+        # cache miss: read the frame back from disk or decode it synchronously,
+        # outside buffer_lock. When stepping backward, decode the GOP up to
+        # nframe at once so that the next steps are served from the buffer
+        frame = self._load_cached(nframe)
         if frame is not None:
             return frame
-        
-        with self.buffer_lock:
-            ret, frame = self.cap.read()
-            if not ret:
-                return None
-            self.buffer.append(frame)
-            self.buffer_range[1] = self.cur_frame
+        start = None
+        if backward and self.keyframes is not None:
+            start = max(self.keyframes.keyframe_before(nframe), nframe - self.buffer.n_behind)
+        return self._decode(nframe, start)
             
-        return frame
+    def move_next(self):
+        if self.cur_frame + 1 >= self.total_frames:
+            return None
+        return self._fetch(self.cur_frame + 1)
         
     def move_prev(self):
         if self.cur_frame - 1 < 0:
             return None
-        self.cur_frame -= 1
-
-        # Try to get from buffer
-        frame = self._get_frame_from_buffer(self.cur_frame)
-        if frame is not None:
-            return frame
-        
-        # manually read frame
-        with self.buffer_lock:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.cur_frame)
-            ret, frame = self.cap.read()
-            if not ret:
-                return None
-            self.buffer.appendleft(frame)
-            self.buffer_range[0] = self.cur_frame
-            
-            if self.buffer_range[1] - self.buffer_range[0] > IMAGE_BUFFER_SIZE:
-                self.buffer.pop()
-                self.buffer_range[1] -= 1
-                
-        return frame
+        return self._fetch(self.cur_frame - 1)
         
     def move_specific_frame(self, nframe):
         if not (0 <= nframe < self.total_frames):
             return None
-        self.cur_frame = nframe
-        
-        # reset
-        with self.buffer_lock:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, nframe)
-            ret, frame = self.cap.read()
-            if not ret:
-                return None
-
-            self.buffer.clear()
-            self.buffer_range = [nframe, nframe + 1]
-            self.buffer.append(frame)
-            
-        return frame
+        return self._fetch(nframe)
             
     def close(self):
-        self.read_thread_active = False
+        with self.buffer_cond:
+            self.read_thread_active = False
+            self.buffer_cond.notify_all()
         self.read_thread.join()
-        self.cap.release()
+        if self.pool is not None:
+            self.pool.close()
+        self.decoder.release()
         
         
 
 class VideoReader:
-    def __init__(self, file_path):
+    def __init__(self, file_path, n_behind=BUFFER_BEHIND, n_ahead=BUFFER_AHEAD,
+                 cache_budget=CACHE_BUDGET, decoder="auto"):
+        self.cache_budget = cache_budget
         self.cur_frame = 0
-        self._init_video(file_path)
+        self.buffer = FrameRingBuffer(n_behind, n_ahead)
+        self._init_video(file_path, decoder)
         
-    def _init_video(self, file_path):
+    def _init_video(self, file_path, decoder="auto"):
         self.file_path = file_path
-        self.cap = cv2.VideoCapture(file_path)
-        if not self.cap.isOpened():
-            raise FileNotFoundError(f"Could not open video file: {file_path}")
-        
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = int(self.cap.get(cv2.CAP_PROP_FPS))
+        open_indexed(self, file_path, decoder)
+        self.frame_size = self.decoder.frame_size
+        self.display_size = None
         self._reset_buffer()
         
     def _reset_buffer(self):
-        self.frame_buffer = []
-        self.num_buffer = 0
-        self.buffer_range = [self.cur_frame, self.cur_frame]
-        
-    def _cache_buffer(self, frame):
-        if self.num_buffer == IMAGE_BUFFER_SIZE:
-            self._reset_buffer()
-        
-        self.frame_buffer.append(frame)
-        self.num_buffer += 1
-        self.buffer_range[1] += 1
+        self.buffer.clear()
+        self.buffer.set_center(self.cur_frame)
         
     def move_next(self):
         self._validate_frame(self.cur_frame+1)
         self.cur_frame += 1
-        if self.buffer_range[0] <= self.cur_frame < self.buffer_range[1]:
-            frame = self._read_frame_from_buffer(self.cur_frame)
-        else:
-            frame = self._read_frame()
-        return frame
+        return self._read_frame(self.cur_frame)
     
     def move_prev(self):
         self._validate_frame(self.cur_frame-1)
         self.cur_frame -= 1
-        if self.buffer_range[0] <= self.cur_frame < self.buffer_range[1]:
-            frame = self._read_frame_from_buffer(self.cur_frame)
-        else:
-            frame = self.move_specific_frame(self.cur_frame)
-        # self.cur_frame -= 1
-        return frame
+        if self.cur_frame not in self.buffer:
+            self._fill_backward(self.cur_frame)
+        return self._read_frame(self.cur_frame)
     
     def move_specific_frame(self, nframe):
         self._validate_frame(nframe)
-        
-        self._reset_buffer()
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, nframe)
         self.cur_frame = nframe
-        return self._read_frame()
+        return self._read_frame(nframe)
+    
+    def _fill_backward(self, nframe):
+        # decode the frames behind the playhead in one forward pass, so the
+        # following backward steps are served from the buffer
+        self.buffer.set_center(nframe)
+        for n in range(max(nframe - self.buffer.n_behind, 0), nframe):
+            self._decode(n)
     
-    @convert_frame
-    def _read_frame_from_buffer(self, nframe):
-        frame = self.frame_buffer[nframe - self.buffer_range[0]]
+    @tracer.traced("reader.fetch")
+    def _read_frame(self, nframe):
+        self.buffer.set_center(nframe)
+        frame = self.buffer.get(nframe)
+        if frame is None:
+            frame = self._decode(nframe)
         return frame
     
-    @convert_frame
-    def _read_frame(self):
-        success, frame = self.cap.read()
-        if not success:
+    def _decode(self, nframe):
+        with tracer.span("reader.seek"):
+            self.decoder.seek(nframe, self.keyframes)
+        with tracer.span("reader.decode"):
+            frame = self.decoder.read(self.display_size)
+        if frame is None:
             raise RuntimeError("Failed to read frame from video.")
-        self._cache_buffer(frame)
+        if self.buffer.put(nframe, frame):
+            return self.buffer.get(nframe)
         return frame
     
+    def set_display_size(self, width, height):
+        display_size = fit_display_size(self.frame_size, width, height)
+        if display_size == self.display_size:
+            return
+        self.display_size = display_size
+        self.buffer.resize(*buffer_window(display_size or self.frame_size,
+                                          budget=self.cache_budget))
+        self._reset_buffer()
+    
+    def set_prefetch_stride(self, stride):
+        self.buffer.stride = stride
+    
+    def set_cache_budget(self, budget):
+        if budget == self.cache_budget:
+            return
+        self.cache_budget = budget
+        self.buffer.resize(*buffer_window(self.display_size or self.frame_size,
+                                          budget=budget))
+        self._reset_buffer()
+    
+    def read_full_frame(self, nframe):
+        self._validate_frame(nframe)
+        self.decoder.seek(nframe, self.keyframes)
+        frame = self.decoder.read()
+        if frame is None:
+            raise RuntimeError("Failed to read frame from video.")
+        return frame.copy()
+    
     def close(self):
-        self.cap.release()
+        self.decoder.release()
         self._reset_buffer()
     
     def _validate_frame(self, nframe):
         if nframe < 0 or nframe >= self.total_frames:
             raise ValueError(f"Frame number {nframe} is out of bounds.")
         
-
@@ -0,0 +1,79 @@
+"""
+Save/load time and file size of the JSON and binary (.bhv) annotation formats.
+
+    python benchmarks/bench_annotation_format.py --bouts 1000000 --behaviors 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from behavior_collector.processing.behavior_collector import BehavInfo
+
+
+def make_behav_set(num_bouts, num_behaviors, max_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    behav_info, behav_frames = {}, {}
+    for i in range(num_behaviors):
+        name = "behavior_%d"%(i)
+        btype = "Event" if i % 2 else "State"
+        behav_info[name] = {"behavior_type": btype, "behavior_note": "", "behavior_color": "#ff0000"}
+
+        starts = np.sort(rng.integers(0, max_frames, num_bouts // num_behaviors)).tolist()
+        if btype == "Event":
+            behav_frames[name] = [[s] for s in starts]
+        else:
+            lengths = rng.integers(1, 300, len(starts)).tolist()
+            behav_frames[name] = [[s, s + l] for s, l in zip(starts, lengths)]
+    return BehavInfo("synthetic.mp4", max_frames, behav_info, behav_frames)
+
+
+def _timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def run(num_bouts=1_000_000, num_behaviors=20, max_frames=10_000_000, repeat=3):
+    behav_set = make_behav_set(num_bouts, num_behaviors, max_frames)
+    results = {"bouts": num_bouts, "behaviors": num_behaviors}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fmt in ("json", "bhv"):
+            path = os.path.join(tmp_dir, "annotation." + fmt)
+            results[fmt] = {
+                "save_s": _timeit(lambda: behav_set.save(path), repeat),
+                "load_s": _timeit(lambda: BehavInfo.load(path), repeat),
+                # open the file and read a single behavior
+                "load_one_s": _timeit(lambda: BehavInfo.load(path).bouts("behavior_0"), repeat),
+                "size_mb": os.path.getsize(path) / 1e6,
+            }
+
+        # lossless round trip
+        path = os.path.join(tmp_dir, "annotation.bhv")
+        restored = BehavInfo.load(path)
+        assert all(restored.bouts(name) == behav_set.bouts(name) for name in behav_set.behav_info)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bouts", type=int, default=1_000_000)
+    parser.add_argument("--behaviors", type=int, default=20)
+    parser.add_argument("--max-frames", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.bouts, args.behaviors, args.max_frames, args.repeat)
+    json.dump(results, sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Time to decode a spread of frames with the DecodePool for several worker counts.
+
+    python benchmarks/bench_decode_pool.py video.mp4 --frames 2000 --stride 8 --workers 1 2 4 8
+"""
+import sys
+import json
+import time
+import argparse
+import cv2
+
+from behavior_collector.processing.decode_pool import DecodePool
+from behavior_collector.processing.keyframe_index import KeyframeIndex
+
+
+def run(file_path, num_frames=2000, stride=8, workers=(1, 2, 4), size=None):
+    cap = cv2.VideoCapture(file_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if size is None:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    keyframes = KeyframeIndex.load_or_build(file_path)
+    frames = list(range(0, min(num_frames * stride, total_frames), stride))
+    results = {"video": file_path, "frames": len(frames), "stride": stride, "size": list(size)}
+    for num_workers in workers:
+        pool = DecodePool(file_path, num_workers=num_workers)
+        # warm up: start the processes and open the video in each of them
+        for _ in pool.decode(frames[:num_workers], size, keyframes):
+            pass
+        t0 = time.perf_counter()
+        count = sum(1 for _ in pool.decode(frames, size, keyframes))
+        elapsed = time.perf_counter() - t0
+        pool.close()
+        results["workers_%d"%(num_workers)] = {"decode_s": elapsed, "fps": count / elapsed}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--stride", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--size", type=int, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"))
+    args = parser.parse_args()
+
+    results = run(args.video, args.frames, args.stride, args.workers, args.size)
+    json.dump(results, sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
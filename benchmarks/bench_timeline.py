@@ -0,0 +1,82 @@
+"""
+Cost of add_frame and move_indicator of the behavior timeline widgets,
+including the repaint they trigger.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_timeline.py --bouts 2000
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+from behavior_collector.gui.video_control import TIMELINE_WIDGETS, timeline_widget_class
+
+COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b"]
+
+
+def _latency(times):
+    times = np.asarray(times) * 1e3
+    return {"p50_ms": float(np.percentile(times, 50)), "p99_ms": float(np.percentile(times, 99)),
+            "mean_ms": float(times.mean())}
+
+
+def bench_widget(app, timeline, num_behaviors=6, num_bouts=1000, num_moves=300,
+                 total_frames=1_000_000, seed=0):
+    widget = timeline_widget_class(timeline)()
+    widget.resize(1600, 200)
+    widget.show()
+    app.processEvents()
+    if getattr(widget, "figure", True) is None:
+        widget.init_ui() # the matplotlib figure is built lazily, not part of the timings
+    widget.set_total_frames(total_frames)
+    for i in range(num_behaviors):
+        widget.add_behavior({"name": "behavior_%d"%(i), "color": COLORS[i % len(COLORS)]})
+    app.processEvents()
+
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.integers(0, total_frames, num_bouts))
+    times = []
+    for i, start in enumerate(starts):
+        t0 = time.perf_counter()
+        widget.add_frame({"name": "behavior_%d"%(i % num_behaviors),
+                          "start_frame": int(start), "end_frame": int(start) + 30})
+        app.processEvents()
+        times.append(time.perf_counter() - t0)
+    results = {"add_frame": _latency(times)}
+
+    times = []
+    for nframe in range(0, 10 * num_moves, 10):
+        t0 = time.perf_counter()
+        widget.move_indicator(nframe)
+        app.processEvents()
+        times.append(time.perf_counter() - t0)
+    results["move_indicator"] = _latency(times)
+
+    widget.close()
+    return results
+
+
+def run(num_behaviors=6, num_bouts=1000, num_moves=300, timelines=tuple(TIMELINE_WIDGETS)):
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    return {timeline: bench_widget(app, timeline, num_behaviors, num_bouts, num_moves)
+            for timeline in timelines}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--behaviors", type=int, default=6)
+    parser.add_argument("--bouts", type=int, default=1000)
+    parser.add_argument("--moves", type=int, default=300)
+    parser.add_argument("--timeline", choices=sorted(TIMELINE_WIDGETS), nargs="+",
+                        default=list(TIMELINE_WIDGETS))
+    args = parser.parse_args()
+
+    results = run(args.behaviors, args.bouts, args.moves, args.timeline)
+    json.dump(results, sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Sequential read, reverse step and random seek latency, memory and idle CPU of
+the video readers.
+
+    python benchmarks/bench_video_reader.py video.mp4 --reader thread --seeks 200 --decoder pyav
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+from behavior_collector.processing import VideoReader, ThreadVideoReader
+from behavior_collector.processing.timestamp_index import load_or_build_indexes
+from behavior_collector.processing.decoders import DECODERS
+
+
+READERS = {"sync": VideoReader, "thread": ThreadVideoReader}
+
+
+def rss_bytes():
+    # resident memory of this process, None where /proc is not available
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def latency_summary(times):
+    times = np.asarray(times) * 1e3
+    return {"p50_ms": float(np.percentile(times, 50)), "p99_ms": float(np.percentile(times, 99)),
+            "max_ms": float(times.max()), "count": len(times)}
+
+
+def _timed(func, *args):
+    t0 = time.perf_counter()
+    frame = func(*args)
+    return time.perf_counter() - t0, frame
+
+
+def run(file_path, reader="thread", num_sequential=300, num_reverse=100, num_seeks=100,
+        display_size=None, idle_seconds=2.0, seed=0, decoder="opencv"):
+    load_or_build_indexes(file_path) # build the sidecars outside the timings
+    rss0 = rss_bytes()
+    t0 = time.perf_counter()
+    video_reader = READERS[reader](file_path, decoder=decoder)
+    results = {"video": os.path.basename(file_path), "reader": reader,
+               "decoder": video_reader.decoder.name, "open_ms": (time.perf_counter() - t0) * 1e3}
+    if display_size is not None:
+        video_reader.set_display_size(*display_size)
+    total_frames = video_reader.total_frames
+    try:
+        # sequential playback at full speed
+        video_reader.move_specific_frame(0)
+        times = []
+        for _ in range(min(num_sequential, total_frames - 1)):
+            dt, frame = _timed(video_reader.move_next)
+            times.append(dt)
+        results["sequential"] = latency_summary(times)
+        results["sequential"]["fps"] = len(times) / sum(times)
+
+        # stepping backward from the middle of the video
+        video_reader.move_specific_frame(min(total_frames // 2 + num_reverse, total_frames - 1))
+        times = [_timed(video_reader.move_prev)[0] for _ in range(num_reverse)]
+        results["reverse_step"] = latency_summary(times)
+
+        # seeking to random frames
+        rng = np.random.default_rng(seed)
+        times = [_timed(video_reader.move_specific_frame, int(nframe))[0]
+                 for nframe in rng.integers(0, total_frames, num_seeks)]
+        results["random_seek"] = latency_summary(times)
+
+        # CPU burned while nothing is requested, after the prefetcher settled
+        time.sleep(0.5)
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        time.sleep(idle_seconds)
+        results["idle_cpu_ratio"] = (time.process_time() - cpu0) / (time.perf_counter() - wall0)
+
+        rss1 = rss_bytes()
+        results["memory"] = {
+            "buffer_mb": video_reader.buffer.nbytes / 1e6,
+            "rss_delta_mb": None if rss0 is None else (rss1 - rss0) / 1e6,
+        }
+        if reader == "thread":
+            results["stats"] = video_reader.stats.summary()
+    finally:
+        video_reader.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video")
+    parser.add_argument("--reader", choices=sorted(READERS), default="thread")
+    parser.add_argument("--decoder", choices=("auto",) + tuple(DECODERS), default="opencv")
+    parser.add_argument("--sequential", type=int, default=300)
+    parser.add_argument("--reverse", type=int, default=100)
+    parser.add_argument("--seeks", type=int, default=100)
+    parser.add_argument("--display", type=int, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--idle", type=float, default=2.0, help="seconds of idle CPU measurement")
+    args = parser.parse_args()
+
+    results = run(args.video, args.reader, args.sequential, args.reverse, args.seeks,
+                  args.display, args.idle, decoder=args.decoder)
+    json.dump(results, sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Run the benchmark suite on synthetic videos and write one JSON report.
+
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py --quick --baseline results.json
+
+With --baseline, the timings that got slower (or the throughputs that got
+lower) by more than --threshold are listed and the exit status is 1.
+"""
+import os
+import sys
+import json
+import platform
+import argparse
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # the timeline benchmark needs no display
+
+import bench_annotation_format
+import bench_video_reader
+import bench_timeline
+from synthetic_video import make_video, measured_gop, video_name
+from behavior_collector.processing.decoders import available_backends
+
+
+FULL = {
+    "codecs": ("mp4v", "MJPG", "avc1"),
+    "sizes": ((640, 480), (1920, 1080)),
+    "gops": (None, 30, 250),
+    "frames": 1800,
+    "seeks": 200,
+    "bouts": 1_000_000,
+    "timeline_bouts": 1000,
+}
+QUICK = {
+    "codecs": ("mp4v", "MJPG"),
+    "sizes": ((320, 240),),
+    "gops": (None,),
+    "frames": 300,
+    "seeks": 50,
+    "bouts": 100_000,
+    "timeline_bouts": 200,
+}
+HIGHER_IS_BETTER = ("fps", "hit_rate")
+MIN_DELTA_MS = 0.05 # timing changes below this are noise, whatever the ratio
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "decoders": available_backends(),
+    }
+
+
+def run_readers(config, tmp_dir):
+    results = []
+    for codec in config["codecs"]:
+        for size in config["sizes"]:
+            for gop in config["gops"]:
+                path = os.path.join(tmp_dir, video_name(codec, size, gop))
+                if not make_video(path, config["frames"], size, codec=codec, gop=gop):
+                    print("skipping %s: cannot encode it here"%(codec), file=sys.stderr)
+                    break
+                for reader in sorted(bench_video_reader.READERS):
+                    for decoder in available_backends():
+                        result = bench_video_reader.run(path, reader, num_seeks=config["seeks"],
+                                                        decoder=decoder)
+                        result.update(codec=codec, size=list(size), gop=gop,
+                                      measured_gop=measured_gop(path))
+                        results.append(result)
+    return results
+
+
+def run(config):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        readers = run_readers(config, tmp_dir)
+    return {
+        "environment": environment(),
+        "video_reader": readers,
+        "annotation_format": bench_annotation_format.run(config["bouts"], repeat=1),
+        "timeline": bench_timeline.run(num_bouts=config["timeline_bouts"]),
+    }
+
+
+def _metrics(results, prefix=""):
+    # flatten to {path: value} with one path per numeric leaf
+    if isinstance(results, dict):
+        items = results.items()
+    elif isinstance(results, list) and all(isinstance(r, dict) for r in results):
+        # identify the reader runs by their parameters rather than their position,
+        # OpenCV runs keep the key they had before there were decoder backends
+        items = (("%s/%s/%s/%s"%(r.get("codec"), "x".join(map(str, r.get("size", []))), r.get("gop"),
+                                 r.get("reader") if r.get("decoder", "opencv") == "opencv"
+                                 else "%s+%s"%(r.get("reader"), r["decoder"])), r) for r in results)
+    else:
+        return {prefix: results} if isinstance(results, (int, float)) else {}
+    metrics = {}
+    for key, value in items:
+        if key != "environment":
+            metrics.update(_metrics(value, "%s/%s"%(prefix, key) if prefix else str(key)))
+    return metrics
+
+
+def compare(results, baseline, threshold=0.2):
+    """Regressions of results against baseline, as (metric, old, new) tuples"""
+    old_metrics, new_metrics = _metrics(baseline), _metrics(results)
+    regressions = []
+    for name, old in old_metrics.items():
+        new = new_metrics.get(name)
+        if new is None or isinstance(old, bool) or not old:
+            continue
+        delta_ms = (new - old) * (1e3 if name.endswith("_s") else 1)
+        timed = name.endswith("_ms") or name.endswith("_s")
+        higher_better = name.rsplit("/", 1)[-1] in HIGHER_IS_BETTER
+        if timed and new > old * (1 + threshold) and delta_ms > MIN_DELTA_MS:
+            regressions.append((name, old, new))
+        elif higher_better and new < old * (1 - threshold):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", default=None, help="JSON report (default: stdout)")
+    parser.add_argument("--quick", action="store_true", help="small videos and fewer repetitions")
+    parser.add_argument("--baseline", default=None, help="report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    results = run(QUICK if args.quick else FULL)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=4)
+        print()
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            regressions = compare(results, json.load(fp), args.threshold)
+        for name, old, new in regressions:
+            print("regression %s: %.4g -> %.4g"%(name, old, new), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Synthetic test videos for the benchmarks.
+
+    python benchmarks/synthetic_video.py out.mp4 --frames 900 --size 640 480 --codec mp4v --gop 30
+"""
+import os
+import argparse
+import cv2
+import numpy as np
+
+from behavior_collector.processing.keyframe_index import KeyframeIndex
+
+
+CODECS = {"mp4v": ".mp4", "avc1": ".mp4", "XVID": ".avi", "MJPG": ".avi"}
+
+
+def make_video(path, num_frames=900, size=(640, 480), fps=30, codec="mp4v", gop=None, seed=0):
+    """
+    Write a video of moving noise with the frame number drawn on every frame.
+
+    gop is passed to the encoder as the keyframe interval, which only some
+    OpenCV/FFmpeg builds honour; use `measured_gop` for the actual value.
+    Returns False if this OpenCV build cannot encode the codec.
+    """
+    params = [] if gop is None else [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, gop]
+    writer = cv2.VideoWriter(path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*codec), fps, size, params)
+    if not writer.isOpened():
+        return False
+
+    width, height = size
+    rng = np.random.default_rng(seed)
+    # low-frequency noise, so the encoder neither gives up nor compresses it away
+    texture = cv2.resize(rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8),
+                         (2 * width, height), interpolation=cv2.INTER_LINEAR)
+    try:
+        for nframe in range(num_frames):
+            shift = (4 * nframe) % width
+            frame = np.ascontiguousarray(texture[:, shift:shift+width])
+            cv2.putText(frame, str(nframe), (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                        height / 160, (255, 255, 255), max(height // 120, 1))
+            writer.write(frame)
+    finally:
+        writer.release()
+    return True
+
+
+def measured_gop(path):
+    # median keyframe interval, None if the packets cannot be scanned
+    index = KeyframeIndex.load_or_build(path)
+    if index is None or len(index.keyframes) < 2:
+        return None
+    return int(np.median(np.diff(index.keyframes)))
+
+
+def video_name(codec, size, gop):
+    return "%s_%dx%d_gop%s%s"%(codec, size[0], size[1], gop or "default", CODECS[codec])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--frames", type=int, default=900)
+    parser.add_argument("--size", type=int, nargs=2, default=[640, 480], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--codec", choices=sorted(CODECS), default="mp4v")
+    parser.add_argument("--gop", type=int, default=None)
+    args = parser.parse_args()
+
+    if not make_video(args.path, args.frames, tuple(args.size), args.fps, args.codec, args.gop):
+        raise SystemExit("Could not encode %s with this OpenCV build"%(args.codec))
+    print("%s: %.1f MB, keyframe every %s frames"%(
+        args.path, os.path.getsize(args.path) / 1e6, measured_gop(args.path)))
+
+
+if __name__ == "__main__":
+    main()
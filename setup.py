@@ -15,6 +15,9 @@ def setup_package():
             "opencv-python",
             "matplotlib"
         ],
+        extras_require={
+            "pyav": ["av"], # threaded FFmpeg decoder backend
+        },
         entry_points={
             "console_scripts": [
                 "behav_collector = behavior_collector.__main__:main",